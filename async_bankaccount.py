@@ -0,0 +1,134 @@
+"""
+Bank accounts for asyncio code.
+
+Operations on an AsyncLedger are queued rather than applied straight
+away, and everything queued during one turn of the event loop is applied
+together, by the event loop's thread.  That's what keeps operations on an
+account from interleaving, so there are no locks to take (or thread hops,
+as with run_in_executor) unless the ledger is shared with other threads.
+Each operation still succeeds or fails on its own, in the order they
+were awaited:
+
+>>> import asyncio
+>>> async def pay_rent():
+...     mary, dana = AsyncBankAccount(100), AsyncBankAccount()
+...     await asyncio.gather(mary.transfer(dana, 80), mary.withdraw(30))
+...
+>>> asyncio.run(pay_rent())
+Traceback (most recent call last):
+  ...
+ValueError: Cannot withdraw. Too poor!
+"""
+import asyncio
+
+from bankaccount import _format_amount, _from_minor_units, _to_minor_units
+from ledger import Ledger
+
+
+class AsyncLedger:
+    """Applies queued operations to a Ledger, a batch per event loop turn.
+
+    Pass an existing ledger to share it with BankAccounts used from
+    threads: then each batch takes the ledger's locks.  A ledger of our
+    own is only ever changed from the event loop, so it isn't locked and
+    shouldn't be used from other threads.
+    """
+
+    def __init__(self, ledger=None):
+        self._shared = ledger is not None
+        self.ledger = Ledger() if ledger is None else ledger
+        self._pending = []
+
+    def _submit(self, operation, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.append((future, operation, args))
+        return future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        ledger = self.ledger
+        if not self._shared:
+            self._apply(pending)
+        else:
+            ledger._acquire_all()
+            try:
+                self._apply(pending)
+            finally:
+                ledger._release_all()
+        journal = ledger.journal
+        if journal is not None and journal.sync_is_due():
+            # Don't hold up the event loop while the disk catches up
+            asyncio.get_running_loop().run_in_executor(None, journal.sync)
+
+    @staticmethod
+    def _apply(pending):
+        for future, operation, args in pending:
+            if future.cancelled():
+                continue
+            try:
+                operation(*args)
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+    def open(self, balance=0):
+        """Add an account (there's nothing to wait for), returning its number."""
+        return self.ledger.open(balance)
+
+    def balance(self, number):
+        return self.ledger.balance(number)
+
+    # Account numbers and amounts are checked now, the Ledger methods we
+    # queue don't
+
+    def deposit(self, number, amount):
+        number = self.ledger._account(number)
+        amount = self.ledger._amount(amount)
+        return self._submit(self.ledger._deposit, number, amount)
+
+    def withdraw(self, number, amount):
+        number = self.ledger._account(number)
+        amount = self.ledger._amount(amount)
+        return self._submit(self.ledger._withdraw, number, amount)
+
+    def transfer(self, source, destination, amount):
+        source = self.ledger._account(source)
+        destination = self.ledger._account(destination)
+        amount = self.ledger._amount(amount)
+        return self._submit(self.ledger._transfer, source, destination, amount)
+
+
+class AsyncBankAccount:
+    """A BankAccount whose deposit, withdraw and transfer are awaited."""
+
+    __slots__ = ("number", "_ledger", "__weakref__")
+
+    ledger = AsyncLedger()
+
+    def __init__(self, balance=0):
+        self._ledger = self.ledger
+        self.number = self._ledger.open(_to_minor_units(balance))
+
+    @property
+    def balance(self):
+        return _from_minor_units(self._ledger.balance(self.number))
+
+    def __repr__(self):
+        return f"AsyncBankAccount(balance={_format_amount(self.balance)})"
+
+    async def deposit(self, amount):
+        await self._ledger.deposit(self.number, _to_minor_units(amount))
+
+    async def withdraw(self, amount):
+        await self._ledger.withdraw(self.number, _to_minor_units(amount))
+
+    async def transfer(self, destination_account, amount):
+        if destination_account._ledger is not self._ledger:
+            raise ValueError("Cannot transfer between accounts in different ledgers")
+        await self._ledger.transfer(
+            self.number, destination_account.number, _to_minor_units(amount)
+        )
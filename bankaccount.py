@@ -5,14 +5,14 @@ Your bank account should accept an optional balance argument (defaulting to 0),
 
 >>> a1 = BankAccount()
 >>> a1.balance
-0
+Decimal('0.00')
 >>> a1.deposit(10)
 >>> a1.balance
-10
+Decimal('10.00')
 >>> a2 = BankAccount(balance=20)
 >>> a2.withdraw(15)
 >>> a2.balance
-5
+Decimal('5.00')
 >>> a1.transfer(a2, 3)
 >>> a1
 BankAccount(balance=7)
@@ -22,33 +22,209 @@ BankAccount(balance=8)
 Your bank account should also have a nice string representation (as shown above).
 """
 
+from decimal import Decimal
+from fractions import Fraction
+from numbers import Number
+import threading
+import weakref
+
+from ledger import MAX_BALANCE, Ledger
+import metrics
+
+
+# Balances are kept as whole numbers of cents, and read back as Decimals
+MINOR_UNITS = 100
+
+# The most any amount or balance can be, 92,233,720,368,547,758.07
+MAX_AMOUNT = Decimal(MAX_BALANCE).scaleb(-2)
+
+
+def _to_minor_units(amount):
+    """Return amount as a whole number of cents."""
+    if type(amount) is int:
+        cents = amount * MINOR_UNITS
+    else:
+        cents = _fraction_to_minor_units(amount)
+    if abs(cents) > MAX_BALANCE:
+        raise ValueError(f"Amounts can't be more than {MAX_AMOUNT}")
+    return cents
+
+
+def _fraction_to_minor_units(amount):
+    if not isinstance(amount, Number):
+        raise TypeError(f"Amounts must be numbers, not {type(amount).__name__}")
+    if isinstance(amount, float):
+        # The float's repr is the amount the caller meant, 0.1 not 0.1000000001
+        amount = Decimal(repr(amount))
+    try:
+        cents = Fraction(amount) * MINOR_UNITS
+    except (ValueError, OverflowError):
+        raise ValueError(f"{amount} isn't an amount of money") from None
+    if cents.denominator != 1:
+        raise ValueError(f"{amount} has a fraction of a cent")
+    return cents.numerator
+
+
+def _from_minor_units(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _format_amount(amount):
+    """Show whole amounts without their cents: 200 but 0.50."""
+    return str(int(amount)) if amount == amount.to_integral_value() else str(amount)
+
+
+class AccountRegistry:
+    """Accounts by account number, in the order they were opened.
+
+    By default the registry only holds weak references, so it doesn't keep
+    accounts alive once nothing else refers to them.  Pass weak=False to
+    keep every account until it's discarded.
+
+    Account numbers are slots in one ledger, which is the registry's ledger
+    attribute (None until BankAccount first adds an account to it).
+    """
+
+    def __init__(self, weak=True, ledger=None):
+        self.weak = weak
+        self.ledger = ledger
+        self._accounts = {}
+
+    def add(self, account):
+        number = account.number
+        if self.weak:
+            accounts = self._accounts
+            self._accounts[number] = weakref.ref(
+                account, lambda ref: accounts.pop(number, None)
+            )
+        else:
+            self._accounts[number] = account
+
+    def discard(self, account):
+        self._accounts.pop(account.number, None)
+
+    def get(self, number, default=None):
+        account = self._accounts.get(number)
+        if account is not None and self.weak:
+            account = account()
+        return default if account is None else account
+
+    def __getitem__(self, number):
+        account = self.get(number)
+        if account is None:
+            raise KeyError(number)
+        return account
+
+    def __contains__(self, account):
+        return self.get(getattr(account, "number", None)) is account
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __iter__(self):
+        # list() copies the dict in one go, even with other threads adding
+        accounts = list(self._accounts.values())
+        if not self.weak:
+            return iter(accounts)
+        accounts = (ref() for ref in accounts)
+        return (account for account in accounts if account is not None)
+
+    def __eq__(self, other):
+        if not isinstance(other, (AccountRegistry, list, tuple)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"AccountRegistry({list(self)!r})"
+
+
+# Only taken when BankAccount.ledger has been replaced
+_registry_lock = threading.Lock()
+
+
 class BankAccount:
+
+    __slots__ = ("number", "_ledger", "__weakref__")
+
+    # Every account that's been opened, by account number
+    accounts = AccountRegistry()
+
+    # Where new accounts keep their balances.  Set ledger.journal to a
+    # journal.Journal to record every operation from then on (starting
+    # with the accounts the ledger already has).  Numbers start again from
+    # 0 in a new ledger, so replacing it starts a new registry too.
+    ledger = Ledger()
     
     # balance=0 is the way we set a default argument,
     # ie we make passing balance in optional
     def __init__(self, balance=0):
-        if balance < 0:
-            raise ValueError("Cannot initialise with negative balance")
-        self.balance = balance
+        ledger = self._ledger = self.ledger
+        self.number = ledger.open(_to_minor_units(balance))
+        self._registry_for(ledger).add(self)
+
+    @classmethod
+    def _registry_for(cls, ledger):
+        accounts = cls.accounts
+        if accounts.ledger is ledger:
+            return accounts
+        with _registry_lock:
+            accounts = cls.accounts
+            if accounts.ledger is None:
+                accounts.ledger = ledger
+            elif accounts.ledger is not ledger:
+                accounts = cls.accounts = AccountRegistry(accounts.weak, ledger)
+            return accounts
+
+    @classmethod
+    def recover(cls, path):
+        """Rebuild the accounts recorded in the journal at path.
+
+        This is meant for starting up a fresh process: the recovered
+        accounts get a new ledger and registry.  Returns a dict of the
+        recovered accounts by account number.
+        """
+        cls.ledger = Ledger.recover(path)
+        cls.accounts = AccountRegistry(weak=cls.accounts.weak, ledger=cls.ledger)
+        accounts = {}
+        for number in range(len(cls.ledger)):
+            account = accounts[number] = cls.__new__(cls)
+            account._ledger = cls.ledger
+            account.number = number
+            cls.accounts.add(account)
+        return accounts
+
+    @classmethod
+    def snapshot(cls):
+        """Return every account's balance by account number, as of one moment.
+
+        Money in the middle of a transfer is never missing, and other
+        threads can carry on with their deposits while we read.
+        """
+        with cls.ledger.snapshot() as snapshot:
+            return {
+                number: _from_minor_units(balance)
+                for number, balance in enumerate(snapshot)
+            }
+
+    @property
+    def balance(self):
+        return _from_minor_units(self._ledger.balance(self.number))
 
     def __repr__(self):
-        return f"BankAccount(balance={self.balance})"
+        return f"BankAccount(balance={_format_amount(self.balance)})"
 
+    @metrics.instrument("bankaccount.deposit")
     def deposit(self, amount):
-        if amount < 0:
-            raise ValueError("Cannot deposit negative amounts")
-        self.balance += amount
+        self._ledger.deposit(self.number, _to_minor_units(amount))
 
+    @metrics.instrument("bankaccount.withdraw")
     def withdraw(self, amount):
-        if amount > self.balance:
-            raise ValueError("Cannot withdraw. Too poor!")
-        self.balance -= amount
+        self._ledger.withdraw(self.number, _to_minor_units(amount))
 
+    @metrics.instrument("bankaccount.transfer")
     def transfer(self, destination_account, amount):
-        # TODO: this check happens inside .deposit(),
-        # can we reuse the validation somehow?
-        if amount < 0:
-            raise ValueError("cannot transfer negative amounts")
-
-        self.withdraw(amount)
-        destination_account.deposit(amount)
+        if destination_account._ledger is not self._ledger:
+            raise ValueError("Cannot transfer between accounts in different ledgers")
+        self._ledger.transfer(
+            self.number, destination_account.number, _to_minor_units(amount)
+        )
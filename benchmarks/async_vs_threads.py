@@ -0,0 +1,94 @@
+"""
+Compare AsyncBankAccount with BankAccount used from threads and asyncio.
+
+Run from the repository root:
+
+    python -m benchmarks.async_vs_threads --clients 64 --operations 2000
+
+Every client (a thread or a task) deposits into one hot account and
+transfers out of it again, which is the worst case for locking.  The
+executor row is what asyncio code does without AsyncBankAccount: each
+blocking BankAccount call goes through loop.run_in_executor.
+"""
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from async_bankaccount import AsyncBankAccount
+from bankaccount import BankAccount
+
+
+def run_threads(clients, operations):
+    hot, other = BankAccount(), BankAccount()
+
+    def client():
+        for _ in range(operations):
+            hot.deposit(1)
+            hot.transfer(other, 1)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, other.balance
+
+
+def run_executor(clients, operations):
+    hot, other = BankAccount(), BankAccount()
+
+    async def client():
+        loop = asyncio.get_running_loop()
+        for _ in range(operations):
+            await loop.run_in_executor(None, hot.deposit, 1)
+            await loop.run_in_executor(None, hot.transfer, other, 1)
+
+    async def main():
+        await asyncio.gather(*(client() for _ in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start, other.balance
+
+
+def run_async(clients, operations):
+    hot, other = AsyncBankAccount(), AsyncBankAccount()
+
+    async def client():
+        for _ in range(operations):
+            await hot.deposit(1)
+            await hot.transfer(other, 1)
+
+    async def main():
+        await asyncio.gather(*(client() for _ in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start, other.balance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--operations", type=int, default=2000, help="per client")
+    args = parser.parse_args()
+
+    total = 2 * args.clients * args.operations
+    print(f"clients={args.clients} operations={total}")
+    print(f"{'version':>10} {'seconds':>9} {'ops/sec':>12}")
+    for name, run in [
+        ("threads", run_threads),
+        ("executor", run_executor),
+        ("async", run_async),
+    ]:
+        seconds, moved = run(args.clients, args.operations)
+        if moved != args.clients * args.operations:
+            sys.exit(f"{name}: money went missing")
+        print(f"{name:>10} {seconds:>9.3f} {total / seconds:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
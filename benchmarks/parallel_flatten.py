@@ -0,0 +1,78 @@
+"""
+Compare deep_flatten with parallel_deep_flatten on growing inputs.
+
+Run from the repository root:
+
+    python -m benchmarks.parallel_flatten --workers 4
+
+Each input is a list of independent subtrees.  Small inputs lose to the
+serial engine because of process startup and pickling; the crossover is
+the first size bigger than one chunk where the speedup column clearly
+goes above 1 (inputs of one chunk never leave the serial engine).
+"""
+import argparse
+import os
+import time
+
+from deep_flatten import deep_flatten, parallel_deep_flatten
+
+
+def make_tree(size):
+    return [[n, [n + 1, (n + 2, [n + 3, "leaf"])], [[n + 4]]] for n in range(size)]
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 300_000, 1_000_000],
+    )
+    args = parser.parse_args()
+
+    print(f"workers={args.workers} chunksize={args.chunksize}")
+    print(f"{'subtrees':>10} {'serial s':>10} {'parallel s':>11} {'speedup':>8}")
+    crossover = None
+    for size in args.sizes:
+        data = make_tree(size)
+        serial = best_time(lambda: list(deep_flatten(data)), args.repeat)
+        parallel = best_time(
+            lambda: list(
+                parallel_deep_flatten(
+                    data, workers=args.workers, chunksize=args.chunksize
+                )
+            ),
+            args.repeat,
+        )
+        # Inputs of one chunk never leave the serial engine, so any speedup
+        # there is just noise
+        single_chunk = size <= args.chunksize
+        if crossover is None and not single_chunk and serial / parallel > 1.1:
+            crossover = size
+        print(
+            f"{size:>10} {serial:>10.3f} {parallel:>11.3f} {serial / parallel:>8.2f}"
+            + ("  (one chunk, runs serially)" if single_chunk else "")
+        )
+    if all(size <= args.chunksize for size in args.sizes):
+        print("every size fits in one chunk, try bigger sizes or a smaller chunksize")
+    elif crossover is None:
+        print("parallel never won, stick to deep_flatten at these sizes")
+    else:
+        print(f"parallel wins from about {crossover} subtrees")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Run every benchmark workload and compare the results with a baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.run --save        # record benchmarks/baseline.json
+    python -m benchmarks.run               # compare with it
+
+Each workload is timed several times, with the garbage collector off,
+and the best run gives its operations per second.  Peak memory is
+measured in a separate run under tracemalloc, which slows things down
+too much to time at the same time.  Inputs come from fixed seeds, so
+every run does the same work.
+
+Comparing exits with status 1 if any workload got slower, or used more
+memory, by more than --threshold (a fraction, 0.1 is 10%).  Baselines
+depend on the machine, so record one on the machine you compare on.
+Use --scale to shrink every workload for a quick run (baselines store
+the scale they were made with and only compare like with like).
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+from deep_flatten import deep_flatten
+from fuzzystring import FuzzyString, fuzzy_sorted
+from parse_ranges import compile_ranges, parse_ranges
+
+from benchmarks.bank_transfers import run as run_transfers
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+# Each workload takes a size and returns (operations, function to time),
+# building its input before it's timed
+
+def deep_tree(depth):
+    tree = [depth]
+    for level in range(depth):
+        tree = [level, tree]
+    return depth + 1, lambda: list(deep_flatten(tree))
+
+
+def wide_tree(subtrees):
+    tree = [
+        [n, [n + 1, (n + 2, [n + 3, "leaf"])], [[n + 4]]] for n in range(subtrees)
+    ]
+    return subtrees * 6, lambda: list(deep_flatten(tree))
+
+
+def huge_span(span):
+    spec = f"0-{span - 1}"
+    return span, lambda: sum(len(batch) for batch in parse_ranges(spec, batch=4096))
+
+
+def many_ranges(ranges):
+    rng = random.Random(0)
+    spec = ",".join(
+        f"{start}-{start + rng.randrange(50)}"
+        for start in rng.sample(range(ranges * 100), ranges)
+    )
+    # Parse from a stream, or the parse cache would do all the work
+    return ranges, lambda: compile_ranges(io.StringIO(spec))
+
+
+def random_words(count):
+    rng = random.Random(0)
+    letters = string.ascii_letters + "éÉßøÅ"
+    return [
+        "".join(rng.choices(letters, k=rng.randrange(3, 12))) for _ in range(count)
+    ]
+
+
+def fuzzy_sort(count):
+    words = random_words(count)
+    return count, lambda: fuzzy_sorted(words)
+
+
+def fuzzy_dedupe(count):
+    words = random_words(count)
+    return count, lambda: len(set(map(FuzzyString, words)))
+
+
+def contended_transfers(transfers):
+    threads = 8
+    per_thread = max(1, transfers // threads)
+    return threads * per_thread, lambda: run_transfers(threads, 4, per_thread)
+
+
+WORKLOADS = {
+    "deep_flatten.deep": (deep_tree, 50_000),
+    "deep_flatten.wide": (wide_tree, 200_000),
+    "parse_ranges.huge_span": (huge_span, 10_000_000),
+    "parse_ranges.many_ranges": (many_ranges, 200_000),
+    "fuzzystring.sort": (fuzzy_sort, 1_000_000),
+    "fuzzystring.dedupe": (fuzzy_dedupe, 1_000_000),
+    "bankaccount.contended_transfers": (contended_transfers, 200_000),
+}
+
+
+def measure(workload, size, repeat):
+    """Return the ops/sec and peak memory (in bytes) of one workload."""
+    operations, function = workload(size)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": operations / min(times), "peak_memory": peak}
+
+
+def compare(results, baseline, threshold):
+    """Return a message for each way results regressed from baseline.
+
+    Workloads missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:,.0f} ops/sec, "
+                f"down from {before['ops_per_sec']:,.0f}"
+            )
+        if result["peak_memory"] > before["peak_memory"] * (1 + threshold):
+            regressions.append(
+                f"{name}: peak memory {result['peak_memory']:,} bytes, "
+                f"up from {before['peak_memory']:,}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="record a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only", nargs="+", default=[], help="only run workloads with these prefixes"
+    )
+    args = parser.parse_args()
+
+    names = [
+        name for name in WORKLOADS
+        if not args.only or name.startswith(tuple(args.only))
+    ]
+    results = {}
+    print(f"{'workload':>32} {'ops/sec':>14} {'peak MiB':>9}")
+    for name in names:
+        workload, size = WORKLOADS[name]
+        result = results[name] = measure(
+            workload, max(1, int(size * args.scale)), args.repeat
+        )
+        print(
+            f"{name:>32} {result['ops_per_sec']:>14,.0f}"
+            f" {result['peak_memory'] / 2**20:>9.1f}"
+        )
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "scale": args.scale,
+                "results": results,
+            }, file, indent=2)
+        print(f"saved {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        sys.exit(f"no baseline at {args.baseline}, make one with --save")
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["scale"] != args.scale:
+        sys.exit(f"the baseline was made with --scale {baseline['scale']}")
+    regressions = compare(results, baseline["results"], args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,473 @@
+from array import array
+from collections import deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from numbers import Complex, Integral, Real
+import os
+import pickle
+import sys
 
-def deep_flatten(thing):
-    if not hasattr(thing, "__iter__"):
-        return [thing]
+import metrics
 
-    if isinstance(thing, str):
-        return [thing]
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, we fall back to array.array
+    np = None
 
-    flattened = []
-    for item in thing:
-        flattened.extend(deep_flatten(item))
-    return flattened
+
+# memoryview/struct format codes for numbers (array's "u" is deliberately
+# missing, those are characters not numbers)
+_INTEGRAL_FORMATS = frozenset("bBhHiIlLqQnN?")
+_NUMERIC_FORMATS = _INTEGRAL_FORMATS | frozenset("efd")
+
+_BLOCK_TYPES = (array, memoryview) if np is None else (array, memoryview, np.ndarray)
+
+# How many numbers we convert at a time when yielding from a numeric block
+_BLOCK_CHUNK = 4096
+
+
+def _as_block(thing):
+    """Return a flat, numeric view of thing's contents, or None.
+
+    Numeric NumPy arrays, array.array objects and memoryviews can be handed
+    around as whole blocks instead of being walked one element at a time.
+    """
+    if not isinstance(thing, _BLOCK_TYPES):
+        return None
+    if np is not None and isinstance(thing, np.ndarray):
+        return thing.reshape(-1) if thing.dtype.kind in "biuf" else None
+    view = memoryview(thing)
+    if view.format.lstrip("@") not in _NUMERIC_FORMATS or view.ndim == 0:
+        return None
+    if view.ndim > 1:
+        if not view.c_contiguous:
+            return None
+        view = view.cast("B").cast(view.format.lstrip("@"))
+    return view
+
+
+def _iter_block(thing):
+    # Python can't iterate over multi-dimensional memoryviews
+    if isinstance(thing, memoryview) and thing.ndim > 1:
+        return iter(thing.tolist())
+    return iter(thing)
+
+
+def _block_items(block):
+    for start in range(0, len(block), _BLOCK_CHUNK):
+        yield from block[start:start + _BLOCK_CHUNK].tolist()
+
+
+class _Chunk:
+    """A numeric block passed through the walk untouched (for as_array)."""
+
+    __slots__ = ("block",)
+
+    def __init__(self, block):
+        self.block = block
+
+
+def _block_chunk(block):
+    return (_Chunk(block),)
+
+
+# Handler for types whose instances may be numeric blocks, for strings
+# that aren't atomic, and the marker for types we haven't seen yet
+_BLOCK = object()
+_CHARACTERS = object()
+_UNSEEN = object()
+
+
+class _Policy:
+    """Decides, once per concrete type, how deep_flatten treats its instances.
+
+    The handler for a type is None for leaves, _BLOCK for possible numeric
+    blocks, _CHARACTERS for strings (when str isn't atomic), or a callable
+    returning the children of a container. Mappings expanded by the values
+    method of the type they were registered for go in keyed, since their
+    keys make better index paths than positions.
+    """
+
+    def __init__(self, atomic, expand):
+        self.atomic = atomic
+        self.expand = dict(expand)
+        self.handlers = {}
+        self.keyed = set()
+
+    def resolve(self, cls):
+        handler = None
+        if not issubclass(cls, self.atomic):
+            for base in cls.__mro__:
+                if base in self.expand:
+                    handler = self.expand[base]
+                    if issubclass(cls, Mapping) and handler is getattr(
+                        base, "values", None
+                    ):
+                        self.keyed.add(cls)
+                    break
+            else:
+                if issubclass(cls, str):
+                    handler = _CHARACTERS
+                elif issubclass(cls, _BLOCK_TYPES):
+                    handler = _BLOCK
+                elif hasattr(cls, "__iter__"):
+                    handler = iter
+        self.handlers[cls] = handler
+        return handler
+
+
+_DEFAULT_POLICY = _Policy((str,), {})
+
+
+@lru_cache(maxsize=32)
+def _cached_policy(atomic, expand_items):
+    return _Policy(atomic, expand_items)
+
+
+def _policy(atomic, expand):
+    if isinstance(atomic, type):
+        atomic = (atomic,)
+    atomic = tuple(atomic)
+    if atomic == (str,) and not expand:
+        return _DEFAULT_POLICY
+    expand = expand or {}
+    try:
+        return _cached_policy(atomic, tuple(expand.items()))
+    except TypeError:  # unhashable handlers, don't bother caching
+        return _Policy(atomic, expand)
+
+
+def _walk(thing, policy, on_block, limit, deepest=None):
+    """Yield the leaves of thing, and the items on_block gives for blocks.
+
+    If deepest is a list, deepest[0] is raised to len(stack) - 1 levels
+    above the deepest leaf we've yielded, for metrics.
+    """
+    handlers = policy.handlers
+    resolve = policy.resolve
+
+    # Containers on the path from the root to the current item, keyed by id.
+    # Seeing one of them again means the input contains itself.
+    on_path = {}
+    containers = []
+    # The bottom iterator just yields the root, so items of stack[-1] are
+    # nested len(stack) - 1 levels deep
+    stack = [iter((thing,))]
+    while stack:
+        for item in stack[-1]:
+            handler = handlers.get(type(item), _UNSEEN)
+            if handler is _UNSEEN:
+                handler = resolve(type(item))
+            if handler is None or len(stack) > limit:
+                if deepest is not None and len(stack) > deepest[0]:
+                    deepest[0] = len(stack)
+                yield item
+                continue
+            if handler is _CHARACTERS:
+                # Each character is a string made of itself, so characters
+                # are leaves (walking them would look like a cycle)
+                if deepest is not None and item and len(stack) >= deepest[0]:
+                    deepest[0] = len(stack) + 1
+                yield from item
+                continue
+            if handler is _BLOCK:
+                if len(stack) + getattr(item, "ndim", 1) - 1 <= limit:
+                    block = _as_block(item)
+                    if block is not None:
+                        if deepest is not None and len(block):
+                            depth = len(stack) + getattr(item, "ndim", 1)
+                            deepest[0] = max(deepest[0], depth)
+                        yield from on_block(block)
+                        continue
+                handler = _iter_block
+            if id(item) in on_path:
+                raise ValueError("Cannot flatten a recursive structure")
+            on_path[id(item)] = item
+            containers.append(item)
+            stack.append(iter(handler(item)))
+            break
+        else:
+            stack.pop()
+            if containers:
+                del on_path[id(containers.pop())]
+
+
+def _walk_paths(thing, policy, limit):
+    """Like _walk, but yield (index_path, leaf) tuples.
+
+    Path components are positions, except for mappings expanded by their
+    values (expand={dict: dict.values}), whose components are their keys.
+    """
+    handlers = policy.handlers
+    resolve = policy.resolve
+    keyed = policy.keyed
+
+    on_path = {}
+    containers = []
+    # The index path of the container each iterator on the stack walks over
+    # (None for the bottom iterator, which just yields the root)
+    prefixes = [None]
+    stack = [iter(((None, thing),))]
+    while stack:
+        prefix = prefixes[-1]
+        for index, item in stack[-1]:
+            path = () if prefix is None else (*prefix, index)
+            handler = handlers.get(type(item), _UNSEEN)
+            if handler is _UNSEEN:
+                handler = resolve(type(item))
+            if handler is None or len(stack) > limit:
+                yield path, item
+                continue
+            if handler is _CHARACTERS:
+                for position, character in enumerate(item):
+                    yield (*path, position), character
+                continue
+            if handler is _BLOCK:
+                # Only 1-d blocks, so flat positions are also index paths
+                block = _as_block(item) if getattr(item, "ndim", 1) == 1 else None
+                if block is not None:
+                    for position, number in enumerate(_block_items(block)):
+                        yield (*path, position), number
+                    continue
+                handler = _iter_block
+            if id(item) in on_path:
+                raise ValueError("Cannot flatten a recursive structure")
+            on_path[id(item)] = item
+            containers.append(item)
+            prefixes.append(path)
+            if type(item) in keyed:
+                # A mapping expanded to its values, its keys make better paths
+                stack.append(iter(item.items()))
+            else:
+                stack.append(enumerate(handler(item)))
+            break
+        else:
+            stack.pop()
+            prefixes.pop()
+            if containers:
+                del on_path[id(containers.pop())]
+
+
+def _to_array(items):
+    chunks = []
+    numbers = []
+    for item in items:
+        if type(item) is _Chunk:
+            if numbers:
+                chunks.append(numbers)
+                numbers = []
+            chunks.append(item.block)
+        elif isinstance(item, Complex):
+            numbers.append(item)
+        else:
+            raise TypeError(f"Cannot put {type(item).__name__} in a numeric array")
+    if numbers:
+        chunks.append(numbers)
+
+    if np is not None:
+        if not chunks:
+            return np.empty(0)
+        # concatenate sizes the result once and bulk-copies each block in
+        return np.concatenate([np.asarray(chunk) for chunk in chunks])
+
+    integral = all(
+        chunk.format.lstrip("@") in _INTEGRAL_FORMATS
+        if isinstance(chunk, memoryview)
+        else all(isinstance(n, Integral) for n in chunk)
+        for chunk in chunks
+    )
+    if not integral and not all(
+        isinstance(chunk, memoryview) or all(isinstance(n, Real) for n in chunk)
+        for chunk in chunks
+    ):
+        raise TypeError("Complex numbers need NumPy for as_array=True")
+    result = array("q" if integral else "d")
+    for chunk in chunks:
+        if (
+            isinstance(chunk, memoryview)
+            and chunk.format.lstrip("@") == result.typecode
+            and chunk.c_contiguous
+        ):
+            result.frombytes(chunk.cast("B"))
+        else:
+            result.extend(chunk)
+    return result
+
+
+def _record_call(leaves, depth):
+    metrics.count("deep_flatten.calls")
+    metrics.count("deep_flatten.leaves", leaves)
+    metrics.observe("deep_flatten.depth", depth, metrics.SIZES)
+
+
+def _measured(thing, policy, limit):
+    """Yield the leaves of thing like _walk, counting them and their depth."""
+    # The bottom of _walk's stack just yields the root, which is depth 0
+    deepest = [1]
+    leaves = 0
+    try:
+        for leaf in _walk(thing, policy, _block_items, limit, deepest):
+            leaves += 1
+            yield leaf
+    finally:
+        _record_call(leaves, deepest[0] - 1)
+
+
+def _measured_paths(walk):
+    """Yield the (index_path, leaf) tuples from walk, counting them."""
+    leaves = depth = 0
+    try:
+        for path, leaf in walk:
+            leaves += 1
+            if len(path) > depth:
+                depth = len(path)
+            yield path, leaf
+    finally:
+        _record_call(leaves, depth)
+
+
+def _measured_array(thing, policy, limit):
+    deepest = [1]
+    result = _to_array(_walk(thing, policy, _block_chunk, limit, deepest))
+    _record_call(len(result), deepest[0] - 1)
+    return result
+
+
+def deep_flatten(
+    thing,
+    *,
+    as_array=False,
+    atomic=(str,),
+    expand=None,
+    max_depth=None,
+    enumerate_paths=False,
+):
+    """Lazily yield the leaves of an arbitrarily nested iterable.
+
+    Rather than recursing, we keep an explicit stack of iterators (one per
+    nesting level we're currently inside), so memory grows with the depth
+    of the input rather than the size of the output, and deeply nested
+    inputs don't hit the recursion limit.
+
+    Numeric NumPy arrays, array.array objects and memoryviews are treated
+    as blocks of numbers and converted a chunk at a time.  With
+    as_array=True, all leaves (which must then be numbers) are returned as
+    a single NumPy array, or an array.array if NumPy isn't installed.
+
+    Instances of the atomic types are never flattened (strings by default).
+    Leave str out of atomic and strings are flattened into their characters.
+    expand maps types to a function returning the children to flatten for
+    their instances, e.g. {dict: dict.values}.  How to treat each type is
+    worked out the first time we see it and then cached.
+
+    max_depth limits how many levels below the top are flattened: with
+    max_depth=0 the items of thing are yielded as they are.  With
+    enumerate_paths=True we yield (index_path, leaf) tuples, where
+    index_path holds the position of the leaf at each level of nesting
+    (or its key, for mappings expanded by their values, so a config dict
+    gives paths like ("server", "port")).
+    """
+    if max_depth is None:
+        limit = sys.maxsize
+    elif max_depth < 0:
+        raise ValueError("max_depth cannot be negative")
+    else:
+        limit = max_depth + 1
+    policy = _policy(atomic, expand)
+    if enumerate_paths:
+        if as_array:
+            raise ValueError("Cannot combine as_array and enumerate_paths")
+        if metrics.enabled:
+            return _measured_paths(_walk_paths(thing, policy, limit))
+        return _walk_paths(thing, policy, limit)
+    if as_array:
+        if metrics.enabled:
+            return _measured_array(thing, policy, limit)
+        return _to_array(_walk(thing, policy, _block_chunk, limit))
+    if metrics.enabled:
+        return _measured(thing, policy, limit)
+    return _walk(thing, policy, _block_items, limit)
+
+
+def _picklable(thing):
+    try:
+        pickle.dumps(thing)
+    except Exception:
+        return False
+    return True
+
+
+def _splits_into_items(data, options):
+    """Return whether deep_flatten would walk data's items one by one.
+
+    Only then is flattening slices of data the same as flattening data,
+    not when data is atomic or a block, or has an expand handler.
+    """
+    policy = _policy(options.get("atomic", (str,)), options.get("expand"))
+    handler = policy.handlers.get(type(data), _UNSEEN)
+    if handler is _UNSEEN:
+        handler = policy.resolve(type(data))
+    return handler is iter
+
+
+def _flatten_chunk(chunk, start, options):
+    """Flatten one slice of the top-level sequence in a worker process."""
+    leaves = deep_flatten(chunk, **options)
+    if options.get("enumerate_paths"):
+        return [((start + path[0], *path[1:]), leaf) for path, leaf in leaves]
+    return list(leaves)
+
+
+def parallel_deep_flatten(data, workers=None, chunksize=1000, **options):
+    """Flatten the items of a big top-level sequence across processes.
+
+    data is cut into slices of chunksize items, each slice is flattened in
+    a process pool and the leaves are yielded in order as they come back.
+    Only a couple of slices per worker are in flight at a time.  Other
+    keyword arguments are passed on to deep_flatten (except as_array).
+
+    Inputs we can't split or send to other processes (generators, small
+    sequences, unpicklable items or options) are flattened serially.
+    Process startup and pickling make this a loss on small inputs, see
+    benchmarks/parallel_flatten.py for where it starts to pay off.
+    """
+    if options.get("as_array"):
+        raise ValueError("parallel_deep_flatten doesn't support as_array")
+    workers = workers or os.cpu_count() or 1
+    if (
+        workers == 1
+        or not isinstance(data, Sequence)
+        or isinstance(data, (str, bytes))
+        or len(data) <= chunksize
+        or not _splits_into_items(data, options)
+        or not _picklable(options)
+    ):
+        yield from deep_flatten(data, **options)
+        return
+
+    starts = iter(range(0, len(data), chunksize))
+    pool = ProcessPoolExecutor(workers)
+
+    def submit(start):
+        chunk = data[start:start + chunksize]
+        future = pool.submit(_flatten_chunk, chunk, start, options)
+        return future, chunk, start
+
+    try:
+        pending = deque(submit(start) for start in islice(starts, 2 * workers))
+        while pending:
+            future, chunk, start = pending.popleft()
+            try:
+                leaves = future.result()
+            except (pickle.PicklingError, TypeError, AttributeError):
+                if _picklable(chunk):
+                    raise
+                leaves = _flatten_chunk(chunk, start, options)
+            next_start = next(starts, None)
+            if next_start is not None:
+                pending.append(submit(next_start))
+            yield from leaves
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,31 +1,478 @@
 from __future__ import annotations
 
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+import unicodedata
+
+import metrics
+
+
+_FORMS = ("NFC", "NFD", "NFKC", "NFKD")
+
+
+@lru_cache(maxsize=65536)
+def _normalize(text: str, form: str) -> str:
+    if metrics.enabled:
+        metrics.count("fuzzystring.unicode_normalizations")
+    # Normalising again after casefolding is what Unicode calls a caseless
+    # match, casefolding can un-normalise a string
+    return unicodedata.normalize(form, unicodedata.normalize(form, text).casefold())
+
+
+def _fuzzy_key(text: str, form: str) -> str:
+    """Return the normalised, casefolded form of text."""
+    if metrics.enabled:
+        metrics.count("fuzzystring.keys")
+    if text.isascii():
+        # Every normalisation form leaves ASCII alone, and casefolding it
+        # is the same as lowercasing it
+        return text.lower()
+    # A plain str for the memo, FuzzyStrings hash by the key we're making
+    return _normalize(str(text), form)
+
+
+def _key_of(other: object, form: str) -> str | None:
+    """Return the key other compares by, or None if it isn't a string."""
+    if isinstance(other, FuzzyString):
+        return other._key if other._form == form else _fuzzy_key(other, form)
+    if isinstance(other, str):
+        return _fuzzy_key(other, form)
+    return None
+
+
+def _compared_key(other: object, form: str) -> str | None:
+    """Return the key to compare other by, or None if it can't be compared.
+
+    FuzzyStrings using different forms don't compare, as each hashes by
+    its own form's key and recomputing one side's key isn't symmetric.
+    """
+    if isinstance(other, FuzzyString) and other._form != form:
+        return None
+    return _key_of(other, form)
+
+
+def _cached_key(string: str, form: str) -> str | None:
+    """Return string's key if we can have it without normalising."""
+    if isinstance(string, FuzzyString):
+        try:
+            key = object.__getattribute__(string, "_key")
+        except AttributeError:  # not worked out yet
+            return None
+        return key if string._form == form else None
+    if string.isascii():
+        return string.lower()
+    return None
+
+
+def _joined_key(parts: list[str], form: str) -> str | None:
+    """Return the key of the joined parts from their keys, if that's safe.
+
+    Normalisation can reorder or compose characters across the boundary
+    between two parts, but never in front of an ASCII character, so we
+    only join keys when every part after the first starts with one.
+    """
+    keys = []
+    for part in parts:
+        if keys and part and not part[0].isascii():
+            return None
+        key = _cached_key(part, form)
+        if key is None:
+            return None
+        keys.append(key)
+    return "".join(keys)
+
+
+def _char_masks(pattern: str) -> dict[str, int]:
+    """Return a bitmask of where each character occurs in pattern."""
+    masks: dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | 1 << i
+    return masks
+
+
+def _edit_distance(
+    masks: dict[str, int], length: int, text: str, max_distance: int
+) -> int | None:
+    """Return the Levenshtein distance between a pattern and text.
+
+    This is Myers' bit-parallel algorithm, as formulated by Hyyrö: bit i of
+    the vectors says whether the distance goes up or down between rows i
+    and i + 1 of the usual dynamic programming column, so a whole column
+    takes a handful of int operations.  The pattern is given by its
+    _char_masks and length.  Returns None as soon as the distance must be
+    more than max_distance.
+    """
+    if abs(length - len(text)) > max_distance:
+        return None
+    if not length:
+        return len(text)
+    all_bits = (1 << length) - 1
+    last_bit = 1 << (length - 1)
+    plus, minus = all_bits, 0
+    distance = length
+    remaining = len(text)
+    for char in text:
+        remaining -= 1
+        equal = masks.get(char, 0)
+        vertical = equal | minus
+        horizontal = (((equal & plus) + plus) ^ plus) | equal
+        plus_h = minus | ~(horizontal | plus) & all_bits
+        minus_h = plus & horizontal
+        if plus_h & last_bit:
+            distance += 1
+        elif minus_h & last_bit:
+            distance -= 1
+        # The distance can only fall by one per character left
+        if distance - remaining > max_distance:
+            return None
+        plus_h = (plus_h << 1 | 1) & all_bits
+        minus_h = (minus_h << 1) & all_bits
+        plus = minus_h | ~(vertical | plus_h) & all_bits
+        minus = plus_h & vertical
+    return distance if distance <= max_distance else None
+
+
 class FuzzyString(str):
+    """A string that compares case-insensitively and Unicode-normalised.
+
+    Set normalization (on a subclass, or per instance when creating one) to
+    choose the Unicode normalisation form used, NFKD by default.
+    FuzzyStrings using different forms are never equal and can't be ordered.
+    """
+
+    normalization = "NFKD"
+
+    # _key is the string we compare by, worked out on first use, and _form
+    # the normalisation form used for it
+    __slots__ = ("_key", "_form")
+
+    def __new__(
+        cls, *args: object, normalization: str | None = None, **kwargs: str
+    ) -> FuzzyString:
+        # Other arguments are str's, like FuzzyString(b"x", "utf-8")
+        self = super().__new__(cls, *args, **kwargs)
+        if normalization is not None:
+            if normalization not in _FORMS:
+                raise ValueError(f"normalization must be one of {', '.join(_FORMS)}")
+            self._form = normalization
+        return self
+
+    @classmethod
+    def sort_key(cls, string: str) -> str:
+        """Return the key to sort string by, for sorted(..., key=...)."""
+        key = _key_of(string, cls.normalization)
+        if key is None:
+            raise TypeError(f"Cannot make a fuzzy key for {type(string).__name__}")
+        return key
+
+    def __getattr__(self, name: str) -> str:
+        # Only called while the slot is still empty
+        if name == "_key":
+            self._key = key = _fuzzy_key(self, self._form)
+            return key
+        if name == "_form":
+            self._form = form = self.normalization
+            return form
+        raise AttributeError(
+            f"{type(self).__name__!r} object has no attribute {name!r}"
+        )
 
     def __eq__(self, other: object) -> bool:
-        # TODO: look into casefold
-        return self.casefold() == other.casefold()
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key == other_key
 
     def __ne__(self, other: object) -> bool:
-        return self.casefold() != other.casefold()
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key != other_key
+
+    # Equal FuzzyStrings have the same key, so hashing the key keeps sets
+    # and dicts consistent (a plain str only hashes like its normalised form)
+    def __hash__(self) -> int:
+        return hash(self._key)
 
     def __repr__(self) -> str:
         return repr(str(self))
 
     def __gt__(self, other: object) -> bool:
-        return self.casefold() > other
-    
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key > other_key
+
     def __ge__(self, other: object) -> bool:
-        return self.casefold() >= other
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key >= other_key
 
     def __lt__(self, other: object) -> bool:
-        return self.casefold() < other
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key < other_key
 
     def __le__(self, other: object) -> bool:
-        return self.casefold() <= other
+        other_key = _compared_key(other, self._form)
+        if other_key is None:
+            return NotImplemented
+        return self._key <= other_key
 
     def __add__(self, other: object) -> FuzzyString:
-        return FuzzyString(str(self) + other)
+        result = FuzzyString(str(self) + other, normalization=self._form)
+        key = _joined_key([self, other], self._form)
+        if key is not None:
+            result._key = key
+        return result
+
+    def join(self, strings: Iterable[str]) -> FuzzyString:
+        """Join strings with self in between, returning a FuzzyString."""
+        builder = FuzzyStringBuilder(normalization=self._form)
+        for i, string in enumerate(strings):
+            if i:
+                builder.append(self)
+            builder.append(string)
+        return builder.build()
+
+    def matches(self, other: str, max_distance: int = 0) -> bool:
+        """Return whether other is at most max_distance edits from self.
+
+        Edits (insertions, deletions and substitutions) are counted on
+        the normalised, casefolded keys, so differences of case are free.
+        """
+        other_key = _key_of(other, self._form)
+        if other_key is None:
+            raise TypeError(f"Cannot match against {type(other).__name__}")
+        key = self._key
+        if key == other_key:
+            return True
+        return _edit_distance(
+            _char_masks(key), len(key), other_key, max_distance
+        ) is not None
 
     def __contains__(self, needle: object) -> bool:
-        return needle.casefold() in self.casefold()
+        needle_key = _key_of(needle, self._form)
+        if needle_key is None:
+            raise TypeError(
+                f"'in <string>' requires string as left operand, "
+                f"not {type(needle).__name__}"
+            )
+        return needle_key in self._key
+
+
+class FuzzyStringBuilder:
+    """Collects string parts and makes a single FuzzyString out of them.
+
+    Adding FuzzyStrings together makes a new FuzzyString at every step,
+    whereas a builder only joins the parts once, in build().  Where the
+    parts' keys are already known and it's safe to, the key of the result
+    is made by joining them rather than by normalising the whole string.
+    """
+
+    __slots__ = ("_parts", "_form")
+
+    def __init__(
+        self, parts: Iterable[str] = (), normalization: str | None = None
+    ) -> None:
+        self._form = normalization or FuzzyString.normalization
+        self._parts: list[str] = []
+        self.extend(parts)
+
+    def append(self, part: str) -> FuzzyStringBuilder:
+        if not isinstance(part, str):
+            raise TypeError(f"Can only append strings, not {type(part).__name__}")
+        self._parts.append(part)
+        return self
+
+    def extend(self, parts: Iterable[str]) -> FuzzyStringBuilder:
+        for part in parts:
+            self.append(part)
+        return self
+
+    def build(self) -> FuzzyString:
+        result = FuzzyString("".join(self._parts), normalization=self._form)
+        key = _joined_key(self._parts, self._form)
+        if key is not None:
+            result._key = key
+        return result
+
+
+def fuzzy_sorted(strings: Iterable[str], *, reverse: bool = False) -> list[str]:
+    """Sort strings the way FuzzyStrings compare.
+
+    Each key is worked out once and the sorting itself compares plain
+    strs, which is a lot faster than calling FuzzyString.__lt__.
+    """
+    return sorted(strings, key=FuzzyString.sort_key, reverse=reverse)
+
+
+def fuzzy_equals_many(needle: str, haystack: Iterable[str]) -> list[bool]:
+    """Return whether needle fuzzily equals each string in haystack.
+
+    This agrees with ==, so FuzzyStrings using another form than needle's
+    (and things that aren't strings) are never equal to it.
+    """
+    form = needle._form if isinstance(needle, FuzzyString) else FuzzyString.normalization
+    key = _key_of(needle, form)
+    if key is None:
+        raise TypeError(f"Cannot make a fuzzy key for {type(needle).__name__}")
+    if isinstance(needle, FuzzyString):
+        return [_compared_key(string, form) == key for string in haystack]
+    # A plain str compares in the form of whichever FuzzyString it meets
+    return [
+        string == needle
+        if isinstance(string, FuzzyString) and string._form != form
+        else _key_of(string, form) == key
+        for string in haystack
+    ]
+
+
+def fuzzy_search(
+    needle: str, haystack: Iterable[str], max_distance: int = 1
+) -> list[tuple[str, int]]:
+    """Return (string, distance) for the strings near needle, nearest first.
+
+    Only strings at most max_distance edits from needle are returned, ties
+    keep their order in haystack.  Distances are between the normalised
+    keys, as for FuzzyString.matches.
+    """
+    if max_distance < 0:
+        raise ValueError("max_distance can't be negative")
+    form = needle._form if isinstance(needle, FuzzyString) else FuzzyString.normalization
+    key = FuzzyString(needle, normalization=form)._key
+    masks, length = _char_masks(key), len(key)
+    matches = []
+    for string in haystack:
+        other_key = _key_of(string, form)
+        if other_key is None:
+            raise TypeError(f"Cannot match against {type(string).__name__}")
+        if other_key == key:
+            matches.append((string, 0))
+            continue
+        distance = _edit_distance(masks, length, other_key, max_distance)
+        if distance is not None:
+            matches.append((string, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+class FuzzyIndex:
+    """A collection of strings indexed by FuzzyString's normalised keys.
+
+    Exact lookups hash the key, prefix lookups bisect a sorted list of keys
+    and substring lookups intersect an inverted index of the keys' n-grams
+    (substrings of length ngram).
+    """
+
+    def __init__(
+        self,
+        strings: Iterable[str] = (),
+        ngram: int = 3,
+        normalization: str | None = None,
+    ) -> None:
+        if ngram < 1:
+            raise ValueError("ngram must be at least 1")
+        self._ngram = ngram
+        self._form = normalization or FuzzyString.normalization
+        self._strings: dict[str, list[FuzzyString]] = {}
+        self._grams: dict[str, set[str]] = {}
+        self._len = 0
+        for string in strings:
+            self._add(string)
+        self._keys = sorted(self._strings)
+
+    def _grams_of(self, key: str) -> set[str]:
+        n = self._ngram
+        return {key[i:i + n] for i in range(len(key) - n + 1)}
+
+    def _add(self, string: str) -> str | None:
+        """Add string, returning its key if we hadn't seen that key before."""
+        if not isinstance(string, FuzzyString):
+            string = FuzzyString(string, normalization=self._form)
+        key = _key_of(string, self._form)
+        self._len += 1
+        strings = self._strings.get(key)
+        if strings is not None:
+            strings.append(string)
+            return None
+        self._strings[key] = [string]
+        for gram in self._grams_of(key):
+            self._grams.setdefault(gram, set()).add(key)
+        return key
+
+    def add(self, string: str) -> None:
+        key = self._add(string)
+        if key is not None:
+            insort(self._keys, key)
+
+    def remove(self, string: str) -> None:
+        """Remove one string equal to string, raise KeyError if there's none."""
+        key = _fuzzy_key(string, self._form)
+        strings = self._strings.get(key)
+        if strings is None:
+            raise KeyError(string)
+        # Prefer removing the exact string, any equal string will do though
+        for i, candidate in enumerate(strings):
+            if str.__eq__(candidate, string):
+                del strings[i]
+                break
+        else:
+            del strings[0]
+        self._len -= 1
+        if strings:
+            return
+        del self._strings[key]
+        del self._keys[bisect_left(self._keys, key)]
+        for gram in self._grams_of(key):
+            keys = self._grams[gram]
+            keys.discard(key)
+            if not keys:
+                del self._grams[gram]
+
+    def discard(self, string: str) -> None:
+        if string in self:
+            self.remove(string)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[FuzzyString]:
+        for key in self._keys:
+            yield from self._strings[key]
+
+    def __contains__(self, string: object) -> bool:
+        key = _key_of(string, self._form)
+        return key is not None and key in self._strings
+
+    def find(self, string: str) -> list[FuzzyString]:
+        """Return the strings equal to string."""
+        return list(self._strings.get(_fuzzy_key(string, self._form), ()))
+
+    def with_prefix(self, prefix: str) -> list[FuzzyString]:
+        """Return the strings starting with prefix, in sorted order."""
+        prefix = _fuzzy_key(prefix, self._form)
+        keys = self._keys
+        matches = []
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            matches += self._strings[keys[i]]
+            i += 1
+        return matches
+
+    def with_substring(self, needle: str) -> list[FuzzyString]:
+        """Return the strings containing needle, in sorted order."""
+        needle = _fuzzy_key(needle, self._form)
+        if len(needle) < self._ngram:
+            keys = [key for key in self._keys if needle in key]
+        else:
+            postings = sorted(
+                (self._grams.get(gram, set()) for gram in self._grams_of(needle)),
+                key=len,
+            )
+            candidates = postings[0].intersection(*postings[1:])
+            keys = sorted(key for key in candidates if needle in key)
+        return [string for key in keys for string in self._strings[key]]
@@ -0,0 +1,126 @@
+"""
+An append-only journal of bank account operations.
+
+Every record has the same size: an operation code, the account number,
+the other account's number (for transfers, otherwise -1) and the amount,
+a whole number of minor units (cents).
+Writes are buffered and flushed to disk with one fsync for a whole group
+of records, either once sync_every records are waiting or sync_interval
+seconds after the first of them was written, whichever happens first.
+The fsync happens outside the lock appends take, so appending never waits
+for the disk.
+"""
+import mmap
+import os
+import struct
+import threading
+
+
+OPEN, DEPOSIT, WITHDRAW, TRANSFER = range(4)
+
+_MAGIC = b"MRSLJRN2"
+_RECORD = struct.Struct("<B7xqqq")
+
+
+class Journal:
+
+    def __init__(self, path, sync_every=1000, sync_interval=0.01):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        # Held while syncing, so close() can't close the file under an fsync
+        self._sync_lock = threading.Lock()
+        self._pending = 0
+        self._timer = None
+        self._file = open(path, "a+b")
+        size = self._file.seek(0, os.SEEK_END)
+        if size == 0:
+            self._file.write(_MAGIC)
+            self.sync()
+            return
+        self._file.seek(0)
+        if self._file.read(len(_MAGIC)) != _MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a journal")
+        # Drop the tail of a record we crashed halfway through writing
+        torn = (size - len(_MAGIC)) % _RECORD.size
+        if torn:
+            self._file.truncate(size - torn)
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, operation, account, other, amount, wait=True):
+        """Add a record.
+
+        Every sync_every records this syncs them, unless wait is false:
+        then call sync_due() later, once you're not holding up anyone else.
+        """
+        self.extend([(operation, account, other, amount)], wait)
+
+    def extend(self, records, wait=True):
+        """Add (operation, account, other, amount) records in one write."""
+        data = b"".join(_RECORD.pack(*record) for record in records)
+        with self._lock:
+            self._file.write(data)
+            self._pending += len(data) // _RECORD.size
+            due = self._pending >= self.sync_every
+            if not due and self._timer is None and self.sync_interval is not None:
+                self._timer = threading.Timer(self.sync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+        if due and wait:
+            self.sync()
+
+    def _flush(self):
+        # Called holding self._lock
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._file.flush()
+        self._pending = 0
+
+    def sync(self):
+        """Write every record appended so far to disk."""
+        with self._sync_lock:
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._flush()
+            os.fsync(self._file.fileno())
+
+    def sync_is_due(self):
+        return self._pending >= self.sync_every
+
+    def sync_due(self):
+        """Sync if sync_every records are waiting."""
+        if self.sync_is_due():
+            self.sync()
+
+    def close(self):
+        with self._sync_lock, self._lock:
+            if not self._file.closed:
+                self._flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path):
+    """Yield (operation, account, other, amount) for each record in path."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(_MAGIC)] != _MAGIC:
+                raise ValueError(f"{path} is not a journal")
+            # Ignore the tail of a record we crashed halfway through writing
+            end = size - (size - len(_MAGIC)) % _RECORD.size
+            unpack_from = _RECORD.unpack_from
+            for offset in range(len(_MAGIC), end, _RECORD.size):
+                yield unpack_from(data, offset)
@@ -0,0 +1,436 @@
+"""
+Balances for many accounts, kept in one array indexed by account number.
+
+Every amount a Ledger deals in is a whole number of minor units (cents),
+converting from currency amounts is up to the caller.
+
+A Ledger does the bookkeeping for BankAccount (which is a view onto one
+of its slots), and can also apply whole batches of deposits and
+withdrawals in one call:
+
+>>> ledger = Ledger()
+>>> mary, dana = ledger.open(100), ledger.open()
+>>> ledger.apply_batch([mary, dana, dana], [-30, 30, -10])
+>>> ledger.balance(mary), ledger.balance(dana)
+(70, 20)
+
+Snapshots give a consistent view of every balance, as of the moment they
+were taken, while writers carry on.  Writers don't wait for readers: while
+any snapshot is open, they save a slot's old balance (with a sequence
+number) before changing it, and a snapshot reads past those changes.
+Only the first change after the newest snapshot is saved, and balances no
+open snapshot needs are dropped the next time their slot is written (or
+all at once, when the last snapshot closes).
+"""
+from array import array
+from bisect import bisect_right
+from collections import deque
+from itertools import count
+from operator import index
+import sys
+import threading
+import weakref
+
+from journal import DEPOSIT, OPEN, TRANSFER, WITHDRAW, read_records
+
+
+# The largest balance an array("q") slot can hold
+MAX_BALANCE = 2**63 - 1
+
+
+class BatchRejected(ValueError):
+    """Some rows of a batch were invalid, so none of it was applied."""
+
+    def __init__(self, rejected):
+        # (row index, reason) for each rejected row
+        self.rejected = rejected
+        super().__init__(f"{len(rejected)} rows rejected, nothing was applied")
+
+
+class Ledger:
+
+    def __init__(self, journal=None, stripes=64):
+        self._journal = journal
+        self._balances = array("q")
+        # Accounts share locks: account n uses lock n % stripes.  Batches
+        # take every lock, in order, like transfers take their two.
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._open_lock = threading.Lock()
+        # Sequence numbers of writes and open snapshots (and the oldest and
+        # newest of those, or None), and for each slot written to while a
+        # snapshot was open, (sequence, old balance) pairs
+        self._sequence = count()
+        self._snapshots = set()
+        self._bounds = None
+        self._undo = {}
+        # Snapshots garbage collected since we last looked.  Their
+        # finalizers only queue them here: the collector can run them while
+        # this thread holds our locks, which aren't reentrant.
+        self._pending_closes = deque()
+        self._closes_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._balances)
+
+    def _lock_for(self, number):
+        return self._locks[number % len(self._locks)]
+
+    @staticmethod
+    def _amount(amount):
+        """Return amount as an int, if it fits in a balance."""
+        try:
+            amount = index(amount)
+        except TypeError:
+            raise TypeError("amount isn't a whole number of minor units") from None
+        # Negative amounts are up to each operation
+        if amount > MAX_BALANCE:
+            raise ValueError("amount too large")
+        return amount
+
+    def _account(self, number):
+        """Return number as an int, if it's the number of an account."""
+        number = index(number)
+        # Accounts are never removed, so this stays true once checked
+        if not 0 <= number < len(self._balances):
+            raise IndexError("no such account")
+        return number
+
+    @property
+    def journal(self):
+        """The journal.Journal recording every operation, or None.
+
+        Attaching a journal to a ledger that already has accounts first
+        records them, with their current balances, so the journal can
+        rebuild the ledger on its own.
+        """
+        return self._journal
+
+    @journal.setter
+    def journal(self, journal):
+        with self._open_lock:
+            self._acquire_all()
+            try:
+                self._journal = journal
+                if journal is not None:
+                    journal.extend(
+                        [
+                            (OPEN, number, -1, balance)
+                            for number, balance in enumerate(self._balances)
+                        ],
+                        wait=False,
+                    )
+            finally:
+                self._release_all()
+        self._sync_journal()
+
+    def _record(self, operation, number, other, amount):
+        # Called before changing any balance, so if writing the record
+        # fails, nothing has changed that the journal doesn't know about
+        if self._journal is not None:
+            # Our callers hold account locks, they sync once they let go
+            self._journal.append(operation, number, other, amount, wait=False)
+
+    def _sync_journal(self):
+        journal = self._journal
+        if journal is not None:
+            journal.sync_due()
+
+    def open(self, balance=0):
+        """Add an account, returning its account number."""
+        balance = self._amount(balance)
+        if balance < 0:
+            raise ValueError("Cannot initialise with negative balance")
+        with self._open_lock:
+            number = len(self._balances)
+            self._record(OPEN, number, -1, balance)
+            self._balances.append(balance)
+        self._sync_journal()
+        return number
+
+    def balance(self, number):
+        return self._balances[self._account(number)]
+
+    def _save(self, *numbers):
+        """Keep the balances of numbers for open snapshots, before a write.
+
+        Callers hold the locks for numbers, which snapshots are only opened
+        and closed while holding, so a write sees every snapshot opened
+        before it.
+        """
+        if self._pending_closes:
+            self._drain_closes()
+        # One read, as other writers may be draining too
+        bounds = self._bounds
+        if bounds is None:
+            return
+        oldest, newest = bounds
+        sequence = next(self._sequence)
+        for number in numbers:
+            entry = (sequence, self._balances[number])
+            saved = self._undo.get(number)
+            if saved and saved[0][0] < oldest:
+                # Snapshots only need the first balance saved after they
+                # were taken.  A new list, snapshots reading the old one
+                # still can.
+                saved = saved[bisect_right(saved, (oldest, sys.maxsize)):]
+                self._undo[number] = saved
+            if not saved:
+                self._undo[number] = [entry]
+            elif saved[-1][0] < newest:
+                saved.append(entry)
+            # Otherwise every open snapshot already has the balance it needs
+
+    # The unlocked versions of deposit, withdraw and transfer, for callers
+    # already holding the locks they need
+
+    def _deposit(self, number, amount):
+        if amount < 0:
+            raise ValueError("Cannot deposit negative amounts")
+        if amount > MAX_BALANCE - self._balances[number]:
+            raise ValueError("balance too large")
+        self._record(DEPOSIT, number, -1, amount)
+        self._save(number)
+        self._balances[number] += amount
+
+    def _withdraw(self, number, amount):
+        if amount < 0:
+            raise ValueError("Cannot withdraw negative amounts")
+        if amount > self._balances[number]:
+            raise ValueError("Cannot withdraw. Too poor!")
+        self._record(WITHDRAW, number, -1, amount)
+        self._save(number)
+        self._balances[number] -= amount
+
+    def _transfer(self, source, destination, amount):
+        if amount < 0:
+            raise ValueError("cannot transfer negative amounts")
+        balances = self._balances
+        if amount > balances[source]:
+            raise ValueError("Cannot withdraw. Too poor!")
+        if source == destination:
+            return
+        if amount > MAX_BALANCE - balances[destination]:
+            raise ValueError("balance too large")
+        self._record(TRANSFER, source, destination, amount)
+        self._save(source, destination)
+        balances[source] -= amount
+        balances[destination] += amount
+
+    def _acquire_all(self):
+        # In order, like transfers take their two, so this can't deadlock
+        for lock in self._locks:
+            lock.acquire()
+
+    def _release_all(self):
+        for lock in reversed(self._locks):
+            lock.release()
+
+    def deposit(self, number, amount):
+        number = self._account(number)
+        amount = self._amount(amount)
+        with self._lock_for(number):
+            self._deposit(number, amount)
+        self._sync_journal()
+
+    def withdraw(self, number, amount):
+        number = self._account(number)
+        amount = self._amount(amount)
+        with self._lock_for(number):
+            self._withdraw(number, amount)
+        self._sync_journal()
+
+    def transfer(self, source, destination, amount):
+        source = self._account(source)
+        destination = self._account(destination)
+        amount = self._amount(amount)
+        # Locks are always taken in the same order, so this can't deadlock
+        stripes = len(self._locks)
+        indexes = sorted({source % stripes, destination % stripes})
+        locks = [self._locks[i] for i in indexes]
+        for lock in locks:
+            lock.acquire()
+        try:
+            self._transfer(source, destination, amount)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        self._sync_journal()
+
+    def apply_batch(self, account_numbers, amounts):
+        """Apply amounts (deposits if positive, else withdrawals) to accounts.
+
+        The whole batch is checked first, each row against the balance the
+        rows before it leave behind.  If any row is invalid, nothing is
+        applied and BatchRejected lists the rejected rows.
+        """
+        if len(account_numbers) != len(amounts):
+            raise ValueError("Need as many amounts as account numbers")
+        balances = self._balances
+        # Accounts are never removed, so we can check these before locking
+        size = len(balances)
+        rows = []
+        rejected = []
+        for row, (number, amount) in enumerate(zip(account_numbers, amounts)):
+            try:
+                number = index(number)
+            except TypeError:
+                number = -1
+            if not 0 <= number < size:
+                rejected.append((row, "no such account"))
+                continue
+            try:
+                amount = index(amount)
+            except TypeError:
+                rejected.append((row, "amount isn't a whole number of minor units"))
+                continue
+            rows.append((row, number, amount))
+        self._acquire_all()
+        try:
+            new_balances = {}
+            for row, number, amount in rows:
+                balance = new_balances.get(number, balances[number]) + amount
+                if balance < 0:
+                    rejected.append((row, "Cannot withdraw. Too poor!"))
+                elif balance > MAX_BALANCE:
+                    rejected.append((row, "balance too large"))
+                else:
+                    new_balances[number] = balance
+            if rejected:
+                raise BatchRejected(sorted(rejected))
+            if self._journal is not None:
+                # All of it in one write, before any balance changes
+                self._journal.extend(
+                    [
+                        (WITHDRAW, number, -1, -amount)
+                        if amount < 0
+                        else (DEPOSIT, number, -1, amount)
+                        for row, number, amount in rows
+                    ],
+                    wait=False,
+                )
+            self._save(*new_balances)
+            for number, balance in new_balances.items():
+                balances[number] = balance
+        finally:
+            self._release_all()
+        self._sync_journal()
+
+    def snapshot(self):
+        """Return a LedgerSnapshot of every balance as they are now.
+
+        Close it (or use it as a context manager) when you're done, so the
+        balances kept for it can be dropped.
+        """
+        self._acquire_all()
+        try:
+            self._drain_closes()
+            sequence = next(self._sequence)
+            self._snapshots.add(sequence)
+            oldest = sequence if self._bounds is None else self._bounds[0]
+            self._bounds = (oldest, sequence)
+            size = len(self._balances)
+        finally:
+            self._release_all()
+        return LedgerSnapshot(self, sequence, size)
+
+    def _close_snapshot(self, sequence):
+        self._acquire_all()
+        try:
+            self._pending_closes.append(sequence)
+            self._drain_closes()
+        finally:
+            self._release_all()
+
+    def _drain_closes(self):
+        """Forget the snapshots queued in _pending_closes.
+
+        Callers hold at least one lock stripe, so no snapshot opens
+        meanwhile, but writers on other stripes may be draining as well.
+        Balances the remaining snapshots don't need are left for _save to
+        drop, a slot at a time, rather than walked here.
+        """
+        with self._closes_lock:
+            pending = self._pending_closes
+            if not pending:
+                return
+            while pending:
+                self._snapshots.discard(pending.popleft())
+            if self._snapshots:
+                self._bounds = (min(self._snapshots), max(self._snapshots))
+            else:
+                self._bounds = None
+                self._undo = {}
+
+    @classmethod
+    def recover(cls, path):
+        """Make a ledger by replaying the journal at path.
+
+        Opening account 0 starts the ledger afresh, which is how a journal
+        attached to a ledger with accounts begins.
+        """
+        ledger = cls()
+        balances = ledger._balances
+        for operation, number, other, amount in read_records(path):
+            if operation == OPEN:
+                if number == 0:
+                    del balances[:]
+                if number != len(balances):
+                    raise ValueError(f"{path} doesn't start from an empty ledger")
+                balances.append(amount)
+            elif operation == DEPOSIT:
+                balances[number] += amount
+            elif operation == WITHDRAW:
+                balances[number] -= amount
+            elif operation == TRANSFER:
+                balances[number] -= amount
+                balances[other] += amount
+        return ledger
+
+
+class LedgerSnapshot:
+    """The balances of a ledger's accounts at one moment, in minor units.
+
+    Accounts opened after the snapshot was taken aren't in it.
+    """
+
+    def __init__(self, ledger, sequence, size):
+        self._ledger = ledger
+        self._after = (sequence, sys.maxsize)
+        self._size = size
+        # Only queues the close, the ledger drains the queue under its locks
+        self._close = weakref.finalize(self, ledger._pending_closes.append, sequence)
+
+    def balance(self, number):
+        if not 0 <= number < self._size:
+            raise IndexError("no such account in this snapshot")
+        if not self._close.alive:
+            raise ValueError("snapshot is closed")
+        # Read the balance before looking for saved ones: a writer saves
+        # the old balance before changing it, so if we've read a balance
+        # changed since the snapshot, we'll find what it was
+        balance = self._ledger._balances[number]
+        saved = self._ledger._undo.get(number)
+        if saved:
+            i = bisect_right(saved, self._after)
+            if i < len(saved):
+                balance = saved[i][1]
+        return balance
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return map(self.balance, range(self._size))
+
+    def total(self):
+        return sum(self)
+
+    def close(self):
+        if self._close.detach() is not None:
+            self._ledger._close_snapshot(self._after[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
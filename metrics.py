@@ -0,0 +1,180 @@
+"""
+Opt-in counters and histograms for the morsels' hot paths.
+
+Metrics are off until enable() is called:
+
+>>> import metrics
+>>> from bankaccount import BankAccount
+>>> metrics.enable()
+>>> BankAccount(10).withdraw(20)
+Traceback (most recent call last):
+  ...
+ValueError: Cannot withdraw. Too poor!
+>>> metrics.stats()["counters"]["bankaccount.withdraw.rejected"]
+1
+>>> metrics.disable()
+>>> metrics.reset()
+
+While they're off, instrumented methods are the plain, unwrapped methods
+and other call sites only check the module's enabled flag, so the cost is
+one attribute lookup at most.  See benchmarks/metrics_overhead.py.
+"""
+from functools import wraps
+from math import inf
+import threading
+import time
+
+
+# Upper bounds of the histogram buckets for timings, in seconds
+SECONDS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1, inf)
+
+# And for sizes, like how deeply nested something is
+SIZES = (1, 2, 4, 8, 16, 32, 64, 256, 1024, inf)
+
+enabled = False
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+# (class, attribute, plain method, timed method) for each instrumented method
+_instrumented = []
+
+
+def enable():
+    global enabled
+    enabled = True
+    for owner, attribute, _, timed in _instrumented:
+        setattr(owner, attribute, timed)
+
+
+def disable():
+    global enabled
+    enabled = False
+    for owner, attribute, plain, _ in _instrumented:
+        setattr(owner, attribute, plain)
+
+
+def reset():
+    """Forget every count and observation so far."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+class _Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+def observe(name, value, buckets=SECONDS):
+    """Add value to the histogram called name (made with buckets if new)."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+def stats():
+    """Return a copy of every counter and histogram.
+
+    Histogram buckets map each upper bound to how many values fell at or
+    below it (and above the previous bound).
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(zip(histogram.buckets, histogram.counts)),
+                }
+                for name, histogram in _histograms.items()
+            },
+        }
+
+
+def _metric_name(name):
+    return "morsels_" + name.replace(".", "_")
+
+
+def dump():
+    """Return every metric in the Prometheus text exposition format."""
+    current = stats()
+    lines = []
+    for name, value in sorted(current["counters"].items()):
+        name = _metric_name(name)
+        # The TYPE line names the sample, as prometheus_client writes it
+        lines += [f"# TYPE {name}_total counter", f"{name}_total {value}"]
+    for name, histogram in sorted(current["histograms"].items()):
+        name = _metric_name(name)
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in histogram["buckets"].items():
+            cumulative += bucket_count
+            bound = "+Inf" if bound == inf else repr(bound)
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {histogram['sum']}")
+        lines.append(f"{name}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _timed(name, method):
+    seconds = name + ".seconds"
+    rejected = name + ".rejected"
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except ValueError:
+            count(rejected)
+            raise
+        finally:
+            observe(seconds, time.perf_counter() - start)
+
+    return timed
+
+
+class _Instrumented:
+
+    def __init__(self, name, method):
+        self.name = name
+        self.method = method
+
+    def __set_name__(self, owner, attribute):
+        timed = _timed(self.name, self.method)
+        _instrumented.append((owner, attribute, self.method, timed))
+        setattr(owner, attribute, timed if enabled else self.method)
+
+
+def instrument(name):
+    """Decorate a method to time its calls while metrics are on.
+
+    Timings go in the histogram name + ".seconds", whose count is the
+    number of calls.  Calls raising ValueError are also counted as
+    name + ".rejected".
+    """
+    def decorator(method):
+        return _Instrumented(name, method)
+    return decorator
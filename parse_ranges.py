@@ -1,11 +1,374 @@
-def parse_ranges(range_string):
-    for s in range_string.split(","):
-        if "-" in s:
-            start, end = s.split("-")
-            subrange = range(int(start), int(end) + 1)
-            for item in subrange:
-                yield item
+from array import array
+from bisect import bisect_right
+import codecs
+from functools import lru_cache
+from heapq import heappop, heappush, heappushpop, merge
+from numbers import Integral
+from operator import index
+import re
 
+import metrics
+
+
+# How much we read from a stream at a time
+_READ_SIZE = 64 * 1024
+
+# One comma-separated item: a number, a range of numbers, or a number with
+# an arrow to something else ("20->exit"), which we ignore
+_ITEM = re.compile(r"\s*(\d+)\s*(?:-\s*(\d+)|->[^,]*)?\s*")
+
+_COMMA_SPACE = re.compile(r"\s*,\s*")
+
+# Longer specs are parsed each time rather than cached
+_MAX_CACHED_LENGTH = 4096
+
+
+def _chunks(source):
+    """Yield the text of source, a string or a text or binary stream."""
+    if isinstance(source, str):
+        yield source
+        return
+    if isinstance(source, (bytes, bytearray)):
+        yield source.decode()
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        chunk = source.read(_READ_SIZE)
+        if not chunk:
+            break
+        yield decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray)) else chunk
+    yield decoder.decode(b"", final=True)
+
+
+def _item_bounds(text, start, end, offset):
+    match = _ITEM.fullmatch(text, start, end)
+    if match is None:
+        item = text[start:end]
+        position = offset + start + len(item) - len(item.lstrip())
+        raise ValueError(f"Invalid range {item.strip()!r} at position {position}")
+    first, last = match.groups()
+    first = int(first)
+    return first, (first if last is None else int(last)) + 1
+
+
+def _bounds(source):
+    """Yield a half-open (start, stop) pair for each comma-separated range.
+
+    This scans the text once, a chunk at a time, so we start yielding
+    before a stream has been read to the end.  An empty (or all blank)
+    spec has no ranges, as format_ranges gives for no numbers.
+    """
+    buffer = ""
+    offset = 0  # Position of the start of buffer in the whole input
+    for chunk in _chunks(source):
+        buffer += chunk
+        start = 0
+        comma = buffer.find(",")
+        while comma != -1:
+            yield _item_bounds(buffer, start, comma, offset)
+            start = comma + 1
+            comma = buffer.find(",", start)
+        buffer = buffer[start:]
+        offset += start
+    if offset == 0 and not buffer.strip():
+        return
+    yield _item_bounds(buffer, 0, len(buffer), offset)
+
+
+def _compile(spec):
+    return tuple(_bounds(spec))
+
+
+_compiled = lru_cache(maxsize=256)(_compile)
+
+
+def set_cache_size(maxsize):
+    """Resize (and empty) the cache of parsed specs, None means unbounded."""
+    global _compiled
+    _compiled = lru_cache(maxsize=maxsize)(_compile)
+
+
+def cache_info():
+    """Return the hits, misses, maxsize and currsize of the spec cache."""
+    return _compiled.cache_info()
+
+
+def cache_clear():
+    _compiled.cache_clear()
+
+
+def _cached_bounds(spec):
+    """Return the (start, stop) pairs for spec, parsing it only on a miss.
+
+    Specs that only differ in the whitespace around commas share an entry.
+    """
+    if len(spec) > _MAX_CACHED_LENGTH:
+        return _bounds(spec)
+    try:
+        return _compiled(_COMMA_SPACE.sub(",", spec.strip()))
+    except ValueError:
+        # Parse it again as given so the error has the right position
+        return _bounds(spec)
+
+
+def _batches(bounds, size):
+    batch = array("q")
+    for start, stop in bounds:
+        while start < stop:
+            end = min(stop, start + size - len(batch))
+            batch.extend(range(start, end))
+            start = end
+            if len(batch) == size:
+                yield batch
+                batch = array("q")
+    if batch:
+        yield batch
+
+
+def _counted(bounds):
+    for start, stop in bounds:
+        metrics.count("parse_ranges.ranges")
+        metrics.count("parse_ranges.integers", stop - start)
+        yield start, stop
+
+
+def parse_ranges(source, batch=None):
+    """Yield every integer in a spec like "1-3,5,8-10".
+
+    source can be a string or a text or binary stream.  Arrows to
+    something other than a number, like "20->exit", are ignored.
+    String specs are parsed once and then kept in an LRU cache.
+
+    With batch=N we yield array('q') blocks of N integers instead (the last
+    one may be shorter), which NumPy can wrap without copying using
+    numpy.frombuffer(block, dtype=numpy.int64).
+    """
+    if batch is not None and batch < 1:
+        raise ValueError("batch must be a positive number of integers")
+    bounds = _cached_bounds(source) if isinstance(source, str) else _bounds(source)
+    if metrics.enabled:
+        bounds = _counted(bounds)
+    if batch is not None:
+        yield from _batches(bounds, batch)
+        return
+    for start, stop in bounds:
+        yield from range(start, stop)
+
+
+def _coalesce(intervals):
+    """Merge overlapping and touching intervals, which must be sorted.
+
+    Empty intervals, including reversed ones like 5-3, are dropped.
+    """
+    intervals = ((start, stop) for start, stop in intervals if start < stop)
+    for start, stop in intervals:
+        break
+    else:
+        return
+    for next_start, next_stop in intervals:
+        if next_start > stop:
+            yield start, stop
+            start, stop = next_start, next_stop
+        elif next_stop > stop:
+            stop = next_stop
+    yield start, stop
+
+
+def _format_interval(start, stop):
+    return str(start) if stop == start + 1 else f"{start}-{stop - 1}"
+
+
+def _int_array(numbers):
+    try:
+        return array("q", numbers)
+    except OverflowError:  # too big for 64 bits, settle for a list
+        return list(numbers)
+
+
+class RangeSet:
+    """An immutable set of integers, stored as sorted, merged intervals.
+
+    Membership tests bisect the interval starts, so they take logarithmic
+    time however many integers the set spans.  Iterating is lazy.
+    """
+
+    __slots__ = ("_starts", "_stops", "_len")
+
+    def __init__(self, intervals=()):
+        """Build a set from half-open (start, stop) pairs, in any order."""
+        self._set_intervals(_coalesce(sorted(intervals)))
+
+    def _set_intervals(self, intervals):
+        starts, stops = [], []
+        for start, stop in intervals:
+            starts.append(start)
+            stops.append(stop)
+        self._starts = _int_array(starts)
+        self._stops = _int_array(stops)
+        self._len = sum(stops) - sum(starts)
+
+    @classmethod
+    def _from_sorted(cls, intervals):
+        range_set = cls.__new__(cls)
+        range_set._set_intervals(_coalesce(intervals))
+        return range_set
+
+    def intervals(self):
+        """Return an iterator of the set's half-open (start, stop) pairs."""
+        return zip(self._starts, self._stops)
+
+    def __contains__(self, number):
+        if not isinstance(number, Integral):
+            return False
+        i = bisect_right(self._starts, number) - 1
+        return i >= 0 and number < self._stops[i]
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return bool(self._starts)
+
+    def __iter__(self):
+        for start, stop in self.intervals():
+            yield from range(start, stop)
+
+    def __eq__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+        return list(self.intervals()) == list(other.intervals())
+
+    def __hash__(self):
+        return hash(tuple(self.intervals()))
+
+    def __repr__(self):
+        return f"RangeSet({str(self)!r})"
+
+    def __str__(self):
+        return ",".join(_format_interval(*interval) for interval in self.intervals())
+
+    def union(self, other):
+        return self._from_sorted(merge(self.intervals(), other.intervals()))
+
+    def intersection(self, other):
+        return self._from_sorted(_intersect(self.intervals(), other.intervals()))
+
+    def difference(self, other):
+        return self._from_sorted(_subtract(self.intervals(), other.intervals()))
+
+    def __or__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+        return self.union(other)
+
+    def __and__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+        return self.difference(other)
+
+
+def _intersect(intervals, others):
+    intervals, others = iter(intervals), iter(others)
+    interval, other = next(intervals, None), next(others, None)
+    while interval is not None and other is not None:
+        start = max(interval[0], other[0])
+        stop = min(interval[1], other[1])
+        if start < stop:
+            yield start, stop
+        if interval[1] < other[1]:
+            interval = next(intervals, None)
         else:
-            yield int(s)
+            other = next(others, None)
+
+
+def _subtract(intervals, others):
+    others = iter(others)
+    other = next(others, None)
+    for start, stop in intervals:
+        while other is not None and start < stop:
+            other_start, other_stop = other
+            if other_stop <= start:
+                other = next(others, None)
+            elif other_start >= stop:
+                break
+            else:
+                if other_start > start:
+                    yield start, other_start
+                start = other_stop
+                if other_stop <= stop:
+                    other = next(others, None)
+        if start < stop:
+            yield start, stop
+
+
+def compile_ranges(source):
+    """Parse a spec (a string or stream, as for parse_ranges) into a RangeSet."""
+    if isinstance(source, str):
+        return RangeSet(_cached_bounds(source))
+    return RangeSet(_bounds(source))
+
+
+def _reorder(numbers, window):
+    """Sort numbers that are at most window places out of order."""
+    heap = []
+    for number in numbers:
+        if len(heap) < window:
+            heappush(heap, number)
+        else:
+            yield heappushpop(heap, number)
+    while heap:
+        yield heappop(heap)
+
+
+def _runs(numbers):
+    """Yield a half-open (start, stop) pair for each run of sorted numbers."""
+    numbers = iter(numbers)
+    for start in numbers:
+        break
+    else:
+        return
+    if start < 0:
+        raise ValueError(f"Cannot format negative number {start}")
+    stop = start + 1
+    for number in numbers:
+        if number == stop:
+            stop += 1
+        elif number > stop:
+            yield start, stop
+            start, stop = number, number + 1
+        elif number < start:
+            raise ValueError(f"{number} came after {stop - 1}, numbers must be sorted")
+        # Otherwise it's a repeat of a number we've already got
+    yield start, stop
+
+
+def format_ranges(numbers, stream=None, window=None):
+    """Return a spec like "1-3,5,8-10" for numbers, the inverse of parse_ranges.
+
+    numbers can be any iterable of non-negative integers (anything else is a
+    TypeError), and is read once.
+    It must be sorted, unless window is given: then each number can be up
+    to window places away from where it belongs.  Repeats are dropped.
 
+    With a text stream, the spec is written to it a range at a time
+    instead of being returned.
+    """
+    if window is not None and window < 1:
+        raise ValueError("window must be a positive number of places")
+    # Floats would make specs parse_ranges can't read
+    numbers = map(index, numbers)
+    if window is not None:
+        numbers = _reorder(numbers, window)
+    intervals = _runs(numbers)
+    if stream is None:
+        return ",".join(_format_interval(*interval) for interval in intervals)
+    write = stream.write
+    separator = ""
+    for start, stop in intervals:
+        write(separator + _format_interval(start, stop))
+        separator = ","
@@ -0,0 +1,171 @@
+import asyncio
+from decimal import Decimal
+import os
+import tempfile
+import threading
+import unittest
+
+from async_bankaccount import AsyncBankAccount, AsyncLedger
+from bankaccount import BankAccount
+from journal import Journal
+from ledger import Ledger
+
+
+class AsyncBankAccountTests(unittest.TestCase):
+
+    """Tests for AsyncBankAccount and AsyncLedger."""
+
+    def test_operations(self):
+        async def run():
+            mary_account = AsyncBankAccount(balance=100)
+            dana_account = AsyncBankAccount()
+            await mary_account.deposit(10.5)
+            await mary_account.withdraw(20)
+            await mary_account.transfer(dana_account, 40)
+            return mary_account, dana_account
+
+        mary_account, dana_account = asyncio.run(run())
+        self.assertEqual(mary_account.balance, Decimal("50.50"))
+        self.assertEqual(repr(dana_account), "AsyncBankAccount(balance=40)")
+
+    def test_failures_are_per_operation(self):
+        async def run():
+            mary_account = AsyncBankAccount(balance=100)
+            dana_account = AsyncBankAccount()
+            results = await asyncio.gather(
+                mary_account.transfer(dana_account, 80),
+                mary_account.withdraw(30),
+                dana_account.withdraw(30),
+                mary_account.deposit(-5),
+                return_exceptions=True,
+            )
+            return mary_account, dana_account, results
+
+        mary_account, dana_account, results = asyncio.run(run())
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertIsNone(results[2])
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual((mary_account.balance, dana_account.balance), (20, 50))
+
+    def test_unknown_accounts(self):
+        ledger = AsyncLedger()
+
+        async def run():
+            hot = ledger.open(100)
+            for number, error in ((-1, IndexError), (1, IndexError), ("0", TypeError)):
+                with self.subTest(number=number):
+                    with self.assertRaises(error):
+                        await ledger.deposit(number, 5)
+                    with self.assertRaises(error):
+                        await ledger.withdraw(number, 5)
+                    with self.assertRaises(error):
+                        await ledger.transfer(hot, number, 5)
+                    with self.assertRaises(error):
+                        await ledger.transfer(number, hot, 5)
+            return hot
+
+        hot = asyncio.run(run())
+        self.assertEqual(ledger.balance(hot), 100)
+
+    def test_one_flush_per_loop_turn(self):
+        ledger = AsyncLedger()
+        flushes = []
+        original_flush = ledger._flush
+        ledger._flush = lambda: flushes.append(1) or original_flush()
+
+        async def run():
+            hot = ledger.open(0)
+            await asyncio.gather(*(ledger.deposit(hot, 1) for _ in range(100)))
+            await ledger.withdraw(hot, 50)
+            return hot
+
+        hot = asyncio.run(run())
+        self.assertEqual(ledger.balance(hot), 50)
+        self.assertEqual(len(flushes), 2)
+
+    def test_locks_only_shared_ledgers(self):
+        for ledger, locks in [(AsyncLedger(), 0), (AsyncLedger(Ledger()), 2)]:
+            acquired = []
+            original_acquire = ledger.ledger._acquire_all
+            ledger.ledger._acquire_all = lambda: acquired.append(1) or original_acquire()
+
+            async def run():
+                number = ledger.open(0)
+                await ledger.deposit(number, 1)
+                await ledger.withdraw(number, 1)
+
+            asyncio.run(run())
+            self.assertEqual(len(acquired), locks)
+
+    def test_journal_is_synced_off_the_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "async.journal")
+        with Journal(path, sync_every=2, sync_interval=None) as journal:
+            ledger = AsyncLedger(Ledger(journal))
+
+            async def run():
+                number = ledger.open(0)
+                await asyncio.gather(ledger.deposit(number, 5), ledger.deposit(number, 6))
+                # Let the executor's sync finish
+                await asyncio.sleep(0.05)
+                return journal._pending
+
+            self.assertEqual(asyncio.run(run()), 0)
+        self.assertEqual(Ledger.recover(path).balance(0), 11)
+
+    def test_cancelled_operation_is_skipped(self):
+        ledger = AsyncLedger()
+
+        async def run():
+            number = ledger.open(0)
+            deposit = ledger.deposit(number, 10)
+            deposit.cancel()
+            await ledger.deposit(number, 5)
+            return number
+
+        self.assertEqual(ledger.balance(asyncio.run(run())), 5)
+
+    def test_shared_with_threads(self):
+        ledger = AsyncLedger(BankAccount.ledger)
+        accounts = [BankAccount(balance=100) for _ in range(4)]
+        numbers = [account.number for account in accounts]
+
+        def threaded_transfers():
+            for i in range(500):
+                accounts[i % 4].transfer(accounts[(i + 1) % 4], 1)
+
+        async def async_transfers():
+            for i in range(500):
+                await ledger.transfer(numbers[(i + 1) % 4], numbers[i % 4], 1)
+
+        thread = threading.Thread(target=threaded_transfers)
+        thread.start()
+        asyncio.run(async_transfers())
+        thread.join()
+        self.assertEqual(sum(account.balance for account in accounts), 400)
+
+    def test_different_ledgers(self):
+        other = AsyncBankAccount.__new__(AsyncBankAccount)
+        other._ledger = AsyncLedger(Ledger())
+        other.number = other._ledger.open(0)
+        with self.assertRaises(ValueError):
+            asyncio.run(AsyncBankAccount(10).transfer(other, 5))
+
+
+class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
+    """Custom test runner to avoid FAILED message on unexpected successes."""
+
+    class resultclass(unittest.TextTestResult):
+        def wasSuccessful(self):
+            return not (self.failures or self.errors)
+
+
+if __name__ == "__main__":
+    from platform import python_version
+    import sys
+
+    if sys.version_info < (3, 6):
+        sys.exit("Running {}.  Python 3.6 required.".format(python_version()))
+    unittest.main(verbosity=2, testRunner=AllowUnexpectedSuccessRunner)
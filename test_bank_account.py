@@ -1,6 +1,10 @@
+from decimal import Decimal
+from fractions import Fraction
+import random
+import threading
 import unittest
 
-from bankaccount import BankAccount
+from bankaccount import MAX_AMOUNT, BankAccount
 
 
 class BankAccountTests(unittest.TestCase):
@@ -90,15 +94,102 @@ class BankAccountTests(unittest.TestCase):
         self.assertEqual(mary_account.balance, 10)
         self.assertEqual(dana_account.balance, 90)
 
+    def test_concurrent_transfers_conserve_money(self):
+        accounts = [BankAccount(balance=100) for _ in range(5)]
+
+        def shuffle_money(seed):
+            rng = random.Random(seed)
+            for _ in range(2000):
+                source, destination = rng.sample(accounts, 2)
+                try:
+                    source.transfer(destination, rng.randrange(1, 60))
+                except ValueError:
+                    pass
+                accounts[rng.randrange(5)].transfer(accounts[0], 0)
+
+        threads = [threading.Thread(target=shuffle_money, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(account.balance for account in accounts), 500)
+        self.assertTrue(all(account.balance >= 0 for account in accounts))
+
+    def test_failed_transfer_changes_nothing(self):
+        mary_account = BankAccount(balance=100)
+        # As much as a balance can hold, depositing into this will overflow
+        full_account = BankAccount(balance=MAX_AMOUNT)
+        with self.assertRaises(ValueError):
+            mary_account.transfer(full_account, 20)
+        with self.assertRaises(ValueError):
+            full_account.deposit(Decimal("0.01"))
+        self.assertEqual(mary_account.balance, 100)
+        self.assertEqual(full_account.balance, MAX_AMOUNT)
+
+    def test_amount_limits(self):
+        with self.assertRaises(ValueError):
+            BankAccount(10**17)
+        with self.assertRaises(ValueError):
+            BankAccount().withdraw(-(10**17))
+        with self.assertRaises(ValueError):
+            BankAccount().deposit(MAX_AMOUNT + Decimal("0.01"))
+        # Withdrawing a negative amount would be a deposit in disguise
+        account = BankAccount(0)
+        with self.assertRaises(ValueError):
+            account.withdraw(-5)
+        self.assertEqual(account.balance, 0)
+        account = BankAccount(MAX_AMOUNT)
+        with self.assertRaises(ValueError):
+            account.withdraw(-1)
+        self.assertEqual(account.balance, MAX_AMOUNT)
+
+    def test_amounts_in_cents(self):
+        account = BankAccount(balance=0.1)
+        account.deposit(0.2)
+        self.assertEqual(account.balance, Decimal("0.30"))
+        self.assertEqual(repr(account), "BankAccount(balance=0.30)")
+        account.deposit(Decimal("0.70"))
+        self.assertEqual(account.balance, 1)
+        self.assertEqual(repr(account), "BankAccount(balance=1)")
+        # Always a Decimal, whole or not, so arithmetic works the same
+        self.assertEqual(account.balance, Decimal("1.00"))
+        self.assertIs(type(account.balance), Decimal)
+        self.assertIs(type(BankAccount(0.5).balance), Decimal)
+        account.withdraw(Fraction(1, 4))
+        self.assertEqual(account.balance, Decimal("0.75"))
+        with self.assertRaises(ValueError):
+            account.deposit(Decimal("0.001"))
+        with self.assertRaises(ValueError):
+            account.withdraw(float("nan"))
+        with self.assertRaises(TypeError):
+            account.deposit("10")
+        self.assertEqual(account.balance, Decimal("0.75"))
+
+    def test_snapshot(self):
+        mary_account = BankAccount(balance=100)
+        dana_account = BankAccount(balance=Decimal("0.50"))
+        balances = BankAccount.snapshot()
+        self.assertEqual(balances[mary_account.number], 100)
+        self.assertEqual(balances[dana_account.number], Decimal("0.50"))
+        mary_account.transfer(dana_account, 20)
+        self.assertEqual(balances[mary_account.number], 100)
+        self.assertEqual(BankAccount.snapshot()[dana_account.number], Decimal("20.50"))
+
+    def test_transfer_to_self(self):
+        mary_account = BankAccount(balance=100)
+        mary_account.transfer(mary_account, 100)
+        self.assertEqual(mary_account.balance, 100)
+        with self.assertRaises(ValueError):
+            mary_account.transfer(mary_account, 101)
+
     # To test bonus 2, comment out the next line
-    @unittest.expectedFailure
     def test_account_number_and_accounts_registry(self):
         # Re-import the BankAccount class
         import importlib
-        import bank_account
+        import bankaccount
 
-        importlib.reload(bank_account)
-        from bank_account import BankAccount
+        importlib.reload(bankaccount)
+        from bankaccount import BankAccount
 
         self.assertEqual(BankAccount.accounts, [])
 
@@ -123,8 +214,48 @@ class BankAccountTests(unittest.TestCase):
         self.assertNotEqual(account1.number, account3.number)
         self.assertNotEqual(account2.number, account3.number)
 
+    def test_registry_lookup_and_weak_references(self):
+        import gc
+        from bankaccount import AccountRegistry
+
+        account1 = BankAccount(10)
+        account2 = BankAccount(20)
+        self.assertIs(BankAccount.accounts[account1.number], account1)
+        self.assertIs(BankAccount.accounts.get(account2.number), account2)
+        self.assertIn(account2, BankAccount.accounts)
+        number = account2.number
+        del account2
+        gc.collect()
+        self.assertIsNone(BankAccount.accounts.get(number))
+        with self.assertRaises(KeyError):
+            BankAccount.accounts[number]
+
+        registry = AccountRegistry(weak=False)
+        registry.add(BankAccount(30))
+        gc.collect()
+        self.assertEqual([account.balance for account in registry], [30])
+        registry.discard(next(iter(registry)))
+        self.assertEqual(registry, [])
+
+    def test_new_ledger_starts_a_new_registry(self):
+        from ledger import Ledger
+
+        original_ledger, original_accounts = BankAccount.ledger, BankAccount.accounts
+        self.addCleanup(setattr, BankAccount, "ledger", original_ledger)
+        self.addCleanup(setattr, BankAccount, "accounts", original_accounts)
+        old = BankAccount(5)
+        self.assertIn(old, BankAccount.accounts)
+        BankAccount.ledger = Ledger()
+        new = BankAccount(7)
+        self.assertEqual(new.number, 0)
+        self.assertIs(BankAccount.accounts[0], new)
+        self.assertEqual(BankAccount.accounts, [new])
+        self.assertIs(BankAccount.accounts.ledger, BankAccount.ledger)
+        # The old registry still has the old ledger's accounts
+        self.assertIs(original_accounts[old.number], old)
+        self.assertEqual(old.balance, 5)
+
     # To test bonus 3, comment out the next line
-    @unittest.expectedFailure
     def test_balance_cannot_be_written(self):
         account1 = BankAccount()
         account2 = BankAccount(100)
@@ -0,0 +1,50 @@
+import unittest
+
+from benchmarks.run import WORKLOADS, compare, measure
+
+
+class BenchmarkRunnerTests(unittest.TestCase):
+
+    """Tests for the benchmark runner in benchmarks/run.py."""
+
+    def test_compare(self):
+        baseline = {
+            "steady": {"ops_per_sec": 1000, "peak_memory": 1000},
+            "slower": {"ops_per_sec": 1000, "peak_memory": 1000},
+            "bigger": {"ops_per_sec": 1000, "peak_memory": 1000},
+        }
+        results = {
+            "steady": {"ops_per_sec": 950, "peak_memory": 1050},
+            "slower": {"ops_per_sec": 800, "peak_memory": 1000},
+            "bigger": {"ops_per_sec": 1200, "peak_memory": 1200},
+            "new": {"ops_per_sec": 1, "peak_memory": 10**9},
+        }
+        regressions = compare(results, baseline, threshold=0.1)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("bigger: peak memory"))
+        self.assertTrue(regressions[1].startswith("slower: 800 ops/sec"))
+        self.assertEqual(compare(results, baseline, threshold=0.5), [])
+
+    def test_every_workload_runs(self):
+        for name, (workload, size) in WORKLOADS.items():
+            with self.subTest(name):
+                result = measure(workload, 100, repeat=1)
+                self.assertGreater(result["ops_per_sec"], 0)
+                self.assertGreaterEqual(result["peak_memory"], 0)
+
+
+class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
+    """Custom test runner to avoid FAILED message on unexpected successes."""
+
+    class resultclass(unittest.TextTestResult):
+        def wasSuccessful(self):
+            return not (self.failures or self.errors)
+
+
+if __name__ == "__main__":
+    from platform import python_version
+    import sys
+
+    if sys.version_info < (3, 6):
+        sys.exit("Running {}.  Python 3.6 required.".format(python_version()))
+    unittest.main(verbosity=2, testRunner=AllowUnexpectedSuccessRunner)
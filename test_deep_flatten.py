@@ -1,12 +1,18 @@
+from array import array
 import atexit
-from collections import deque
+from collections import OrderedDict, defaultdict, deque
 from functools import wraps
 import multiprocessing
 import sys
 import unittest
 
 
-from deep_flatten import deep_flatten
+from deep_flatten import deep_flatten, parallel_deep_flatten
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class DeepFlattenTests(unittest.TestCase):
@@ -40,7 +46,6 @@ class DeepFlattenTests(unittest.TestCase):
 
     # To test bonus 2, comment out the next line
 
-    @unittest.expectedFailure
     def test_returns_iterator(self):
         self.assertEqual(next(deep_flatten([0, [1, [2, 3]]])), 0)
         squares = (n**2 for n in [1, 2, 3])
@@ -85,6 +90,195 @@ class DeepFlattenTests(unittest.TestCase):
         timeout_deep_flatten = with_timeout(list_deep_flatten, timeout)
         self.assertEqual(timeout_deep_flatten(inputs), outputs)
 
+    def test_very_deep_nesting(self):
+        inputs = [0]
+        for n in range(1, 10000):
+            inputs = [inputs, n]
+        self.assertIterableEqual(deep_flatten(inputs), range(10000))
+
+    def test_recursive_structure(self):
+        inputs = [1, [2]]
+        inputs[1].append(inputs)
+        with self.assertRaises(ValueError):
+            list(deep_flatten(inputs))
+
+    def test_repeated_but_not_recursive(self):
+        shared = [1, 2]
+        self.assertIterableEqual(deep_flatten([shared, [shared]]), [1, 2, 1, 2])
+
+    def test_numeric_blocks(self):
+        block = array("i", range(10000))
+        self.assertIterableEqual(
+            deep_flatten([0, [block, (1, 2)], memoryview(array("d", [0.5]))]),
+            [0, *range(10000), 1, 2, 0.5],
+        )
+        grid = memoryview(bytes(range(6))).cast("B", (2, 3))
+        self.assertIterableEqual(deep_flatten([grid]), range(6))
+
+    def test_as_array(self):
+        result = deep_flatten([1, [array("b", [2, 3]), (4,)]], as_array=True)
+        self.assertIterableEqual(result, [1, 2, 3, 4])
+        result = deep_flatten([1, [array("d", [2.5]), (4,)]], as_array=True)
+        self.assertIterableEqual(result, [1, 2.5, 4])
+        with self.assertRaises(TypeError):
+            deep_flatten([1, ["two"]], as_array=True)
+
+    def test_atomic_types(self):
+        inputs = [b"ab", ["cd", (b"ef",)]]
+        self.assertIterableEqual(deep_flatten(inputs, atomic=(str, bytes)), [b"ab", "cd", b"ef"])
+        self.assertIterableEqual(deep_flatten([(1, 2), [3]], atomic=tuple), [(1, 2), 3])
+        # Without str, strings are flattened into characters, not cycles
+        self.assertIterableEqual(deep_flatten(["ab", b"c"], atomic=bytes), ["a", "b", b"c"])
+        self.assertIterableEqual(deep_flatten("x", atomic=()), ["x"])
+        self.assertIterableEqual(
+            deep_flatten(["ab", ["c"]], atomic=(), enumerate_paths=True),
+            [((0, 0), "a"), ((0, 1), "b"), ((1, 0, 0), "c")],
+        )
+        self.assertIterableEqual(deep_flatten(["ab"], atomic=(), max_depth=0), ["ab"])
+
+    def test_expand_handlers(self):
+        config = {"a": 1, "b": {"c": [2, 3], "d": "four"}}
+        self.assertIterableEqual(
+            deep_flatten(config, expand={dict: dict.values}),
+            [1, 2, 3, "four"],
+        )
+
+        class Point:
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+
+        points = [Point(1, 2), [Point(3, 4)]]
+        self.assertIterableEqual(
+            deep_flatten(points, expand={Point: lambda p: (p.x, p.y)}),
+            [1, 2, 3, 4],
+        )
+
+    def test_max_depth(self):
+        inputs = [0, [1, [2, [3]]], "four"]
+        self.assertIterableEqual(deep_flatten(inputs, max_depth=0), inputs)
+        self.assertIterableEqual(
+            deep_flatten(inputs, max_depth=1),
+            [0, 1, [2, [3]], "four"],
+        )
+        self.assertIterableEqual(deep_flatten(inputs, max_depth=5), [0, 1, 2, 3, "four"])
+        grid = memoryview(bytes(range(4))).cast("B", (2, 2))
+        self.assertIterableEqual(deep_flatten([grid], max_depth=1), [[0, 1], [2, 3]])
+        with self.assertRaises(ValueError):
+            deep_flatten(inputs, max_depth=-1)
+
+    def test_enumerate_paths(self):
+        inputs = [0, [1, [2, 3]], (), [array("b", [4, 5])]]
+        self.assertIterableEqual(
+            deep_flatten(inputs, enumerate_paths=True),
+            [
+                ((0,), 0),
+                ((1, 0), 1),
+                ((1, 1, 0), 2),
+                ((1, 1, 1), 3),
+                ((3, 0, 0), 4),
+                ((3, 0, 1), 5),
+            ],
+        )
+        self.assertIterableEqual(deep_flatten(7, enumerate_paths=True), [((), 7)])
+        self.assertIterableEqual(
+            deep_flatten(inputs, enumerate_paths=True, max_depth=1),
+            [((0,), 0), ((1, 0), 1), ((1, 1), [2, 3]), ((3, 0), inputs[3][0])],
+        )
+        config = {"a": 1, "b": {"c": 2, "d": ["e", "f"]}}
+        self.assertIterableEqual(
+            deep_flatten(config, enumerate_paths=True, expand={dict: dict.values}),
+            [(("a",), 1), (("b", "c"), 2), (("b", "d", 0), "e"), (("b", "d", 1), "f")],
+        )
+        # Subclasses expanded by the same policy get keys too
+        for mapping in (OrderedDict(x=1, y=2), defaultdict(int, x=1, y=2)):
+            with self.subTest(mapping=type(mapping).__name__):
+                self.assertIterableEqual(
+                    deep_flatten(
+                        mapping,
+                        enumerate_paths=True,
+                        expand={dict: dict.values},
+                    ),
+                    [(("x",), 1), (("y",), 2)],
+                )
+        # Other ways of expanding a mapping still get positions
+        self.assertIterableEqual(
+            deep_flatten(
+                config["b"], enumerate_paths=True, expand={dict: lambda d: d.values()}
+            ),
+            [((0,), 2), ((1, 0), "e"), ((1, 1), "f")],
+        )
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_numpy_arrays(self):
+        grid = np.arange(12).reshape(3, 4)
+        self.assertIterableEqual(deep_flatten([grid, [12]]), range(13))
+        result = deep_flatten([grid, [12.5]], as_array=True)
+        self.assertIsInstance(result, np.ndarray)
+        self.assertEqual(result.dtype, np.float64)
+        self.assertIterableEqual(result, [*range(12), 12.5])
+
+
+class ParallelDeepFlattenTests(unittest.TestCase):
+    """Tests for parallel_deep_flatten."""
+
+    def test_matches_serial_order(self):
+        inputs = [[n, [n + 1, (n + 2, "x")]] for n in range(50)]
+        self.assertEqual(
+            list(parallel_deep_flatten(inputs, workers=2, chunksize=7)),
+            list(deep_flatten(inputs)),
+        )
+
+    def test_options_and_paths(self):
+        inputs = [[n, [n + 1, [n + 2]]] for n in range(20)]
+        self.assertEqual(
+            list(
+                parallel_deep_flatten(
+                    inputs,
+                    workers=2,
+                    chunksize=3,
+                    max_depth=1,
+                    enumerate_paths=True,
+                )
+            ),
+            list(deep_flatten(inputs, max_depth=1, enumerate_paths=True)),
+        )
+
+    def test_unpicklable_inputs_fall_back(self):
+        squares = ((n, n**2) for n in range(10))
+        self.assertEqual(
+            list(parallel_deep_flatten(squares, workers=2, chunksize=2)),
+            list(deep_flatten((n, n**2) for n in range(10))),
+        )
+        # Generators can't be pickled, so that chunk is flattened here
+        inputs = [[1, (n for n in [2, 3])], [4], [5, [6]]]
+        self.assertEqual(
+            list(parallel_deep_flatten(inputs, workers=2, chunksize=1)),
+            [1, 2, 3, 4, 5, 6],
+        )
+        inputs = [[1, 2], [3]]
+        self.assertEqual(
+            list(
+                parallel_deep_flatten(
+                    inputs, workers=2, chunksize=1, expand={list: lambda l: l[::-1]}
+                )
+            ),
+            [3, 2, 1],
+        )
+
+    def test_top_level_handled_like_deep_flatten(self):
+        inputs = tuple(range(10))
+        options = [
+            {"atomic": (str, tuple)},
+            {"expand": {tuple: lambda t: t[::-1]}},
+            {"atomic": (str, tuple), "enumerate_paths": True},
+        ]
+        for kwargs in options:
+            with self.subTest(**{key: repr(value) for key, value in kwargs.items()}):
+                self.assertEqual(
+                    list(parallel_deep_flatten(inputs, workers=2, chunksize=3, **kwargs)),
+                    list(deep_flatten(inputs, **kwargs)),
+                )
+
 
 class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
 
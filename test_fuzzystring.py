@@ -1,7 +1,17 @@
+import random
 import unittest
 
 
-from fuzzystring import FuzzyString
+from fuzzystring import (
+    FuzzyIndex,
+    FuzzyString,
+    FuzzyStringBuilder,
+    _char_masks,
+    _edit_distance,
+    fuzzy_equals_many,
+    fuzzy_search,
+    fuzzy_sorted,
+)
 
 
 class FuzzyStringTests(unittest.TestCase):
@@ -98,6 +108,268 @@ class FuzzyStringTests(unittest.TestCase):
         self.assertEqual('\u0065\u0301', accented_e)
         self.assertIn(accent, accented_e)
 
+    def test_normalization_forms(self):
+        # Composed forms keep the accent in one code point
+        accented_e = FuzzyString("\u00e9", normalization="NFC")
+        self.assertEqual(accented_e, "\u0065\u0301")
+        self.assertNotIn("\u0301", accented_e)
+
+        class ComposedString(FuzzyString):
+            normalization = "NFKC"
+
+        self.assertEqual(ComposedString("\ufb01le"), "FILE")
+        self.assertNotIn("\u0301", ComposedString("\u00e9"))
+        self.assertEqual(FuzzyString("\u00e9") + "!", "e\u0301!")
+        with self.assertRaises(ValueError):
+            FuzzyString("x", normalization="NFX")
+        # Positional arguments are still str's
+        self.assertEqual(FuzzyString(b"X", "utf-8"), "x")
+        self.assertEqual(FuzzyString(b"X\xff", "ascii", "ignore"), "x")
+        self.assertEqual(FuzzyString(), "")
+
+    def test_mixed_normalization_forms(self):
+        composed = FuzzyString("\u00e9", normalization="NFC")
+        decomposed = FuzzyString("\u00e9")
+        self.assertNotEqual(composed, decomposed)
+        self.assertNotEqual(decomposed, composed)
+        self.assertEqual(len({composed, decomposed}), 2)
+        self.assertEqual(composed, FuzzyString("e\u0301", normalization="NFC"))
+        self.assertEqual(
+            len({composed, FuzzyString("e\u0301", normalization="NFC")}), 1
+        )
+        two = FuzzyString("2")
+        squared = FuzzyString("\u00b2", normalization="NFC")
+        self.assertFalse(two == squared)
+        self.assertFalse(squared == two)
+        self.assertTrue(two != squared)
+        self.assertTrue(squared != two)
+        with self.assertRaises(TypeError):
+            two < squared
+        with self.assertRaises(TypeError):
+            squared > two
+
+    def test_mixed_case_ordering(self):
+        self.assertLess(FuzzyString("apple"), "Banana")
+        self.assertGreater(FuzzyString("banana"), "Apple")
+        self.assertLessEqual(FuzzyString("APPLE"), "apple")
+        self.assertEqual(
+            sorted([FuzzyString("b"), FuzzyString("C"), FuzzyString("A")]),
+            ["a", "b", "c"],
+        )
+
+    def test_builder_and_join(self):
+        new, delhi = FuzzyString("New"), FuzzyString("Delhi")
+        new_delhi = FuzzyStringBuilder([new, " "]).append(delhi).build()
+        self.assertIs(type(new_delhi), FuzzyString)
+        self.assertEqual(str(new_delhi), "New Delhi")
+        self.assertEqual(new_delhi, "NEW delhi")
+        joined = FuzzyString(", ").join(["\u00c9clair", "Stra\u00dfe", "e\u0301"])
+        self.assertIs(type(joined), FuzzyString)
+        self.assertEqual(joined, "e\u0301clair, strasse, \u00e9")
+        self.assertEqual(FuzzyString("-").join([]), "")
+        with self.assertRaises(TypeError):
+            FuzzyStringBuilder().append(1)
+
+    def test_joined_keys_match_normalising(self):
+        # Keys built from the parts' keys must match normalising the whole,
+        # including where combining characters meet across a boundary
+        parts = ["A", "\u0301", "e", "\u00df", " ", "\u1100", "\u1161", "\uf9fb", "x"]
+        rng = random.Random(7)
+        for _ in range(200):
+            chosen = rng.choices(parts, k=rng.randrange(5))
+            for form in ["NFKD", "NFC"]:
+                fuzzy_parts = [FuzzyString(part, normalization=form) for part in chosen]
+                for part in fuzzy_parts:
+                    hash(part)  # works out and caches the part's key
+                built = FuzzyStringBuilder(fuzzy_parts, normalization=form).build()
+                whole = FuzzyString("".join(chosen), normalization=form)
+                self.assertEqual(hash(built), hash(whole), (chosen, form))
+                self.assertTrue(built == whole, (chosen, form))
+        total = FuzzyString("")
+        for part in parts:
+            total = total + part
+        self.assertEqual(total, "".join(parts))
+
+    def test_sort_helpers(self):
+        names = ["banana", "Apple", FuzzyString("cherry"), "apple", "\u00c9clair", "eclair"]
+        self.assertEqual(
+            fuzzy_sorted(names),
+            ["Apple", "apple", "banana", "cherry", "eclair", "\u00c9clair"],
+        )
+        self.assertEqual(fuzzy_sorted(names, reverse=True)[0], "\u00c9clair")
+        self.assertEqual(
+            sorted(names, key=FuzzyString.sort_key),
+            sorted(map(FuzzyString, names)),
+        )
+        with self.assertRaises(TypeError):
+            FuzzyString.sort_key(1)
+
+    def test_equals_many(self):
+        self.assertEqual(
+            fuzzy_equals_many("STRASSE", ["stra\u00dfe", "Strasse", FuzzyString("strase"), "x"]),
+            [True, True, False, False],
+        )
+        composed = FuzzyString("\u00e9", normalization="NFC")
+        haystack = [FuzzyString("\u00c9", normalization="NFD"), "\u00c9", None, 3]
+        self.assertEqual(
+            fuzzy_equals_many(composed, haystack),
+            [composed == string for string in haystack],
+        )
+        self.assertEqual(
+            fuzzy_equals_many("\u00e9", [composed, None]), ["\u00e9" == composed, False]
+        )
+        with self.assertRaises(TypeError):
+            fuzzy_equals_many(None, [None, 3])
+
+    def test_hashing(self):
+        names = {FuzzyString("Tashkent"), FuzzyString("TASHKENT"), FuzzyString("Taipei")}
+        self.assertEqual(len(names), 2)
+        self.assertIn(FuzzyString("taipei"), names)
+        counts = {FuzzyString("Delhi"): 1}
+        self.assertEqual(counts[FuzzyString("DELHI")], 1)
+        self.assertFalse(hasattr(FuzzyString("x"), "__dict__"))
+
+    def test_non_string_comparisons(self):
+        self.assertNotEqual(FuzzyString("1"), 1)
+        with self.assertRaises(TypeError):
+            FuzzyString("1") < 1
+        with self.assertRaises(TypeError):
+            1 in FuzzyString("1")
+
+
+class FuzzyIndexTests(unittest.TestCase):
+
+    """Tests for FuzzyIndex."""
+
+    cities = ["New Delhi", "DELHI", "Tashkent", "taipei", "Taipei", "Stra\u00dfe", "Newark"]
+
+    def test_exact_lookups(self):
+        index = FuzzyIndex(self.cities)
+        self.assertEqual(len(index), 7)
+        self.assertIn("delhi", index)
+        self.assertIn("STRASSE", index)
+        self.assertNotIn("Delhi!", index)
+        self.assertNotIn(42, index)
+        self.assertEqual(index.find("TAIPEI"), ["taipei", "Taipei"])
+        self.assertIsInstance(index.find("TAIPEI")[0], FuzzyString)
+        self.assertEqual(index.find("Paris"), [])
+
+    def test_prefix_and_substring_lookups(self):
+        index = FuzzyIndex(self.cities)
+        self.assertEqual(index.with_prefix("NEW"), ["New Delhi", "Newark"])
+        self.assertEqual(index.with_prefix("ta"), ["taipei", "Taipei", "Tashkent"])
+        self.assertEqual(index.with_substring("DELHI"), ["DELHI", "New Delhi"])
+        self.assertEqual(index.with_substring("ss"), ["Stra\u00dfe"])
+        self.assertEqual(index.with_substring("ew"), ["New Delhi", "Newark"])
+        self.assertEqual(index.with_substring("xyz"), [])
+
+    def test_add_and_remove(self):
+        index = FuzzyIndex()
+        for city in self.cities:
+            index.add(city)
+        index.remove("TAIPEI")
+        self.assertEqual(index.find("taipei"), ["taipei"])
+        index.remove("Taipei")
+        self.assertNotIn("taipei", index)
+        self.assertEqual(index.with_prefix("ta"), ["Tashkent"])
+        self.assertEqual(index.with_substring("aip"), [])
+        with self.assertRaises(KeyError):
+            index.remove("Taipei")
+        index.discard("Taipei")
+        self.assertEqual(len(index), 5)
+
+    def test_matches_linear_scans(self):
+        rng = random.Random(42)
+        catalogue = ["".join(rng.choices("abAB\u00e9c", k=rng.randrange(8))) for _ in range(300)]
+        index = FuzzyIndex(catalogue)
+        for query in ["", "a", "Ab", "abc", "\u00c9a", "bAbA"]:
+            fuzzy_query = FuzzyString(query)
+            self.assertEqual(
+                sorted(map(str, index.with_substring(query))),
+                sorted(s for s in catalogue if query in FuzzyString(s)),
+            )
+            self.assertEqual(
+                sorted(map(str, index.find(query))),
+                sorted(s for s in catalogue if fuzzy_query == s),
+            )
+
+
+def naive_edit_distance(string1, string2):
+    previous = list(range(len(string2) + 1))
+    for i, char1 in enumerate(string1, start=1):
+        current = [i]
+        for j, char2 in enumerate(string2, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char1 != char2),
+            ))
+        previous = current
+    return previous[-1]
+
+
+class ApproximateMatchTests(unittest.TestCase):
+
+    """Tests for FuzzyString.matches and fuzzy_search."""
+
+    def test_edit_distance_matches_naive_version(self):
+        rng = random.Random(2468)
+        for _ in range(2000):
+            string1, string2 = (
+                "".join(rng.choices("abcd", k=rng.randrange(15))) for _ in range(2)
+            )
+            max_distance = rng.randrange(8)
+            distance = naive_edit_distance(string1, string2)
+            self.assertEqual(
+                _edit_distance(
+                    _char_masks(string1), len(string1), string2, max_distance
+                ),
+                distance if distance <= max_distance else None,
+            )
+
+    def test_long_patterns(self):
+        string1 = "abcdefghij" * 20
+        string2 = string1[:50] + "x" + string1[51:150] + string1[152:]
+        self.assertEqual(
+            _edit_distance(_char_masks(string1), len(string1), string2, 5), 3
+        )
+
+    def test_matches(self):
+        self.assertTrue(FuzzyString("Necessary").matches("neccessary", max_distance=1))
+        self.assertFalse(FuzzyString("Necessary").matches("neccesary", max_distance=1))
+        self.assertTrue(FuzzyString("Necessary").matches("NECESSARY"))
+        self.assertTrue(FuzzyString("Straße").matches("strase", max_distance=1))
+        with self.assertRaises(TypeError):
+            FuzzyString("hello").matches(5)
+
+    def test_fuzzy_search(self):
+        catalogue = ["apple", "Apply", "maple", "apples", "banana", "APPLE"]
+        self.assertEqual(
+            fuzzy_search("aple", catalogue, 1),
+            [("apple", 1), ("maple", 1), ("APPLE", 1)],
+        )
+        self.assertEqual(
+            fuzzy_search("apple", catalogue, 1),
+            [("apple", 0), ("APPLE", 0), ("Apply", 1), ("apples", 1)],
+        )
+        self.assertEqual(
+            fuzzy_search("apple", catalogue, 0), [("apple", 0), ("APPLE", 0)]
+        )
+        with self.assertRaises(ValueError):
+            fuzzy_search("apple", catalogue, -1)
+
+    def test_fuzzy_search_matches_naive_version(self):
+        rng = random.Random(1357)
+        catalogue = ["".join(rng.choices("abcAB", k=rng.randrange(10))) for _ in range(300)]
+        for needle in catalogue[:20]:
+            expected = [
+                (string, naive_edit_distance(needle.lower(), string.lower()))
+                for string in catalogue
+            ]
+            expected = [match for match in expected if match[1] <= 2]
+            expected.sort(key=lambda match: match[1])
+            self.assertEqual(fuzzy_search(needle, catalogue, 2), expected)
+
 
 class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
     """Custom test runner to avoid FAILED message on unexpected successes."""
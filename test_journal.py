@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+
+from bankaccount import BankAccount
+from journal import DEPOSIT, OPEN, TRANSFER, WITHDRAW, Journal, read_records
+from ledger import Ledger
+
+
+class JournalTests(unittest.TestCase):
+
+    """Tests for Journal and BankAccount.recover."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "accounts.journal")
+        original_ledger, original_accounts = BankAccount.ledger, BankAccount.accounts
+        self.addCleanup(setattr, BankAccount, "ledger", original_ledger)
+        self.addCleanup(setattr, BankAccount, "accounts", original_accounts)
+        BankAccount.ledger = Ledger()
+
+    def record_accounts(self, journal):
+        BankAccount.ledger.journal = journal
+        try:
+            mary_account = BankAccount(balance=100)
+            dana_account = BankAccount()
+            mary_account.deposit(50)
+            mary_account.withdraw(30)
+            mary_account.transfer(dana_account, 20)
+            with self.assertRaises(ValueError):
+                dana_account.withdraw(1000)
+        finally:
+            BankAccount.ledger.journal = None
+        return mary_account, dana_account
+
+    def test_records(self):
+        with Journal(self.path) as journal:
+            mary_account, dana_account = self.record_accounts(journal)
+        mary, dana = mary_account.number, dana_account.number
+        self.assertEqual(
+            list(read_records(self.path)),
+            [
+                (OPEN, mary, -1, 10000),
+                (OPEN, dana, -1, 0),
+                (DEPOSIT, mary, -1, 5000),
+                (WITHDRAW, mary, -1, 3000),
+                (TRANSFER, mary, dana, 2000),
+            ],
+        )
+
+    def test_recover(self):
+        with Journal(self.path) as journal:
+            mary_account, dana_account = self.record_accounts(journal)
+        accounts = BankAccount.recover(self.path)
+        self.assertEqual(sorted(accounts), [mary_account.number, dana_account.number])
+        self.assertEqual(repr(accounts[mary_account.number]), "BankAccount(balance=100)")
+        self.assertEqual(accounts[dana_account.number].balance, 20)
+        self.assertGreater(BankAccount().number, dana_account.number)
+
+    def test_attach_to_ledger_with_accounts(self):
+        mary_account = BankAccount(balance=100)
+        mary_account.withdraw(40)
+        with Journal(self.path) as journal:
+            dana_account = self.record_accounts(journal)[1]
+        accounts = BankAccount.recover(self.path)
+        self.assertEqual(accounts[mary_account.number].balance, 60)
+        self.assertEqual(accounts[dana_account.number].balance, 20)
+        # Attaching the journal again starts it afresh, from the recovered ledger
+        with Journal(self.path) as journal:
+            BankAccount.ledger.journal = journal
+            accounts[mary_account.number].deposit(1)
+            BankAccount.ledger.journal = None
+        self.assertEqual(Ledger.recover(self.path).balance(mary_account.number), 6100)
+
+    def test_deferred_sync(self):
+        journal = Journal(self.path, sync_every=2, sync_interval=None)
+        self.addCleanup(journal.close)
+        journal.append(DEPOSIT, 1, -1, 5, wait=False)
+        journal.append(DEPOSIT, 1, -1, 5, wait=False)
+        journal.append(DEPOSIT, 1, -1, 5, wait=False)
+        self.assertEqual(journal._pending, 3)
+        journal.sync_due()
+        self.assertEqual(journal._pending, 0)
+        journal.sync_due()
+
+    def test_group_commit(self):
+        journal = Journal(self.path, sync_every=3, sync_interval=None)
+        syncs = []
+        original_flush = journal._flush
+        journal._flush = lambda: syncs.append(journal._pending) or original_flush()
+        for amount in range(7):
+            journal.append(DEPOSIT, 1, -1, amount)
+        self.assertEqual(syncs, [3, 3])
+        journal.close()
+        self.assertEqual(syncs, [3, 3, 1])
+        self.assertEqual(len(list(read_records(self.path))), 7)
+
+    def test_sync_interval(self):
+        journal = Journal(self.path, sync_every=1000, sync_interval=0.01)
+        self.addCleanup(journal.close)
+        journal.append(DEPOSIT, 1, -1, 5)
+        timer = journal._timer
+        if timer is not None:
+            timer.join()
+        self.assertEqual(journal._pending, 0)
+
+    def test_torn_record_is_dropped(self):
+        with Journal(self.path) as journal:
+            journal.append(OPEN, 1, -1, 10)
+            journal.append(DEPOSIT, 1, -1, 5)
+        with open(self.path, "ab") as file:
+            file.write(b"\x01\x00\x00")
+        self.assertEqual(len(list(read_records(self.path))), 2)
+        with Journal(self.path) as journal:
+            journal.append(WITHDRAW, 1, -1, 3)
+        self.assertEqual(
+            list(read_records(self.path)),
+            [(OPEN, 1, -1, 10), (DEPOSIT, 1, -1, 5), (WITHDRAW, 1, -1, 3)],
+        )
+
+    def test_not_a_journal(self):
+        with open(self.path, "wb") as file:
+            file.write(b"hello there")
+        with self.assertRaises(ValueError):
+            Journal(self.path)
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+
+
+class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
+    """Custom test runner to avoid FAILED message on unexpected successes."""
+
+    class resultclass(unittest.TextTestResult):
+        def wasSuccessful(self):
+            return not (self.failures or self.errors)
+
+
+if __name__ == "__main__":
+    from platform import python_version
+    import sys
+
+    if sys.version_info < (3, 6):
+        sys.exit("Running {}.  Python 3.6 required.".format(python_version()))
+    unittest.main(verbosity=2, testRunner=AllowUnexpectedSuccessRunner)
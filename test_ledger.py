@@ -0,0 +1,308 @@
+import gc
+import os
+import tempfile
+import threading
+import unittest
+
+from journal import DEPOSIT, OPEN, WITHDRAW, Journal, read_records
+from ledger import BatchRejected, Ledger
+
+
+class LedgerTests(unittest.TestCase):
+
+    """Tests for Ledger."""
+
+    def test_open_and_balance(self):
+        ledger = Ledger()
+        self.assertEqual([ledger.open(100), ledger.open()], [0, 1])
+        self.assertEqual(len(ledger), 2)
+        self.assertEqual(ledger.balance(0), 100)
+        self.assertEqual(ledger.balance(1), 0)
+        with self.assertRaises(ValueError):
+            ledger.open(-1)
+
+    def test_bad_amounts(self):
+        for journaled in (False, True):
+            with self.subTest(journaled=journaled), tempfile.TemporaryDirectory() as d:
+                journal = Journal(os.path.join(d, "journal")) if journaled else None
+                ledger = Ledger(journal)
+                ledger.open(100)
+                ledger.open(0)
+                bad_amounts = [(1.5, TypeError), ("1", TypeError), (2**64, ValueError)]
+                for amount, error in bad_amounts:
+                    with self.assertRaises(error):
+                        ledger.open(amount)
+                    with self.assertRaises(error):
+                        ledger.deposit(0, amount)
+                    with self.assertRaises(error):
+                        ledger.withdraw(0, amount)
+                    with self.assertRaises(error):
+                        ledger.transfer(0, 1, amount)
+                self.assertEqual((len(ledger), ledger.balance(0)), (2, 100))
+                if journal is not None:
+                    journal.close()
+
+    def test_unknown_accounts(self):
+        ledger = Ledger()
+        ledger.open(100)
+        for number in (-1, 1):
+            with self.subTest(number=number):
+                with self.assertRaises(IndexError):
+                    ledger.balance(number)
+                with self.assertRaises(IndexError):
+                    ledger.deposit(number, 10)
+                with self.assertRaises(IndexError):
+                    ledger.withdraw(number, 10)
+                with self.assertRaises(IndexError):
+                    ledger.transfer(0, number, 10)
+                with self.assertRaises(IndexError):
+                    ledger.transfer(number, 0, 10)
+        self.assertEqual(ledger.balance(0), 100)
+
+    def test_transfer_between_shared_stripe(self):
+        ledger = Ledger(stripes=1)
+        mary, dana = ledger.open(100), ledger.open()
+        ledger.transfer(mary, dana, 40)
+        self.assertEqual((ledger.balance(mary), ledger.balance(dana)), (60, 40))
+        with self.assertRaises(ValueError):
+            ledger.transfer(dana, mary, 41)
+
+    def test_apply_batch(self):
+        ledger = Ledger()
+        mary, dana = ledger.open(100), ledger.open()
+        ledger.apply_batch([mary, dana, dana, mary], [-30, 30, -10, 5])
+        self.assertEqual((ledger.balance(mary), ledger.balance(dana)), (75, 20))
+
+    def test_rejected_batch_changes_nothing(self):
+        ledger = Ledger()
+        mary, dana = ledger.open(100), ledger.open()
+        with self.assertRaises(BatchRejected) as context:
+            ledger.apply_batch([mary, dana, dana, 7], [50, 10, -20, 1])
+        self.assertEqual(
+            context.exception.rejected,
+            [(2, "Cannot withdraw. Too poor!"), (3, "no such account")],
+        )
+        self.assertEqual((ledger.balance(mary), ledger.balance(dana)), (100, 0))
+        with self.assertRaises(ValueError):
+            ledger.apply_batch([mary], [1, 2])
+        with self.assertRaises(BatchRejected) as context:
+            ledger.apply_batch([mary, dana], [2**63 - 100, 1.5])
+        self.assertEqual(
+            context.exception.rejected,
+            [(0, "balance too large"), (1, "amount isn't a whole number of minor units")],
+        )
+        self.assertEqual((ledger.balance(mary), ledger.balance(dana)), (100, 0))
+
+    def test_batch_of_integer_like_numbers(self):
+        class Int64:
+            # Stands in for NumPy's integer types, which aren't ints
+            def __init__(self, value):
+                self.value = value
+
+            def __index__(self):
+                return self.value
+
+        ledger = Ledger()
+        mary, dana = ledger.open(100), ledger.open()
+        ledger.apply_batch([Int64(mary), Int64(dana)], [Int64(-30), Int64(30)])
+        self.assertEqual((ledger.balance(mary), ledger.balance(dana)), (70, 30))
+        with self.assertRaises(BatchRejected) as context:
+            ledger.apply_batch(["0", mary], [1, "2"])
+        self.assertEqual(
+            context.exception.rejected,
+            [(0, "no such account"), (1, "amount isn't a whole number of minor units")],
+        )
+
+    def test_batch_is_journaled(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "ledger.journal")
+        with Journal(path) as journal:
+            ledger = Ledger(journal)
+            mary = ledger.open(100)
+            ledger.apply_batch([mary, mary], [-30, 5])
+        self.assertEqual(
+            list(read_records(path)),
+            [(OPEN, 0, -1, 100), (WITHDRAW, 0, -1, 30), (DEPOSIT, 0, -1, 5)],
+        )
+        self.assertEqual(Ledger.recover(path).balance(mary), 75)
+
+    def test_journal_syncs_after_locks_are_released(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with Journal(os.path.join(directory.name, "ledger.journal"), 1) as journal:
+            ledger = Ledger(journal, stripes=1)
+            held = []
+            original_sync = journal.sync
+            journal.sync = (
+                lambda: held.append(ledger._locks[0].locked()) or original_sync()
+            )
+            mary = ledger.open(100)
+            other = ledger.open()
+            ledger.deposit(mary, 1)
+            ledger.transfer(mary, other, 1)
+            ledger.apply_batch([mary], [-1])
+        self.assertEqual(held, [False] * 5)
+
+    def test_failed_journal_write_changes_nothing(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "ledger.journal")
+        with Journal(path) as journal:
+            ledger = Ledger(journal)
+            mary, dana = ledger.open(100), ledger.open(50)
+        # The journal is closed now, so every write to it fails
+        with self.assertRaises(ValueError):
+            ledger.deposit(mary, 5)
+        with self.assertRaises(ValueError):
+            ledger.withdraw(mary, 5)
+        with self.assertRaises(ValueError):
+            ledger.transfer(mary, dana, 5)
+        with self.assertRaises(ValueError):
+            ledger.apply_batch([mary, dana], [-5, 5])
+        with self.assertRaises(ValueError):
+            ledger.open(10)
+        self.assertEqual(list(ledger.snapshot()), [100, 50])
+        recovered = Ledger.recover(path)
+        self.assertEqual(list(recovered.snapshot()), [100, 50])
+
+    def test_concurrent_batches_and_transfers(self):
+        ledger = Ledger(stripes=4)
+        numbers = [ledger.open(100) for _ in range(10)]
+
+        def move_money(offset):
+            for i in range(200):
+                source = numbers[(i + offset) % 10]
+                destination = numbers[(i + offset + 3) % 10]
+                ledger.transfer(source, destination, 1)
+                ledger.apply_batch([source, destination], [1, -1])
+
+        threads = [
+            threading.Thread(target=move_money, args=(offset,))
+            for offset in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(ledger.balance(n) for n in numbers), 1000)
+        self.assertEqual([ledger.balance(n) for n in numbers], [100] * 10)
+
+
+class SnapshotTests(unittest.TestCase):
+
+    """Tests for Ledger.snapshot."""
+
+    def test_snapshot_ignores_later_writes(self):
+        ledger = Ledger(stripes=2)
+        mary, dana = ledger.open(100), ledger.open(50)
+        with ledger.snapshot() as snapshot:
+            ledger.transfer(mary, dana, 30)
+            ledger.deposit(mary, 5)
+            ledger.apply_batch([dana], [-10])
+            ledger.open(1000)
+            with ledger.snapshot() as later:
+                ledger.withdraw(dana, 20)
+                self.assertEqual(list(snapshot), [100, 50])
+                self.assertEqual(list(later), [75, 70, 1000])
+            self.assertEqual(len(snapshot), 2)
+            with self.assertRaises(IndexError):
+                snapshot.balance(2)
+        self.assertEqual([ledger.balance(n) for n in range(3)], [75, 50, 1000])
+        with self.assertRaises(ValueError):
+            snapshot.balance(0)
+
+    def test_saved_balances_are_dropped(self):
+        ledger = Ledger()
+        number = ledger.open(10)
+        ledger.deposit(number, 1)
+        self.assertEqual(ledger._undo, {})
+        first = ledger.snapshot()
+        ledger.deposit(number, 1)
+        second = ledger.snapshot()
+        ledger.deposit(number, 1)
+        self.assertEqual(len(ledger._undo[number]), 2)
+        first.close()
+        self.assertEqual(len(ledger._undo[number]), 2)
+        ledger.deposit(number, 1)  # drops what only the first one needed
+        self.assertEqual(len(ledger._undo[number]), 1)
+        self.assertEqual(list(second), [12])
+        del second  # garbage collected snapshots close on the next write
+        ledger.deposit(number, 1)
+        self.assertEqual(ledger._undo, {})
+        self.assertIsNone(ledger._bounds)
+
+    def test_snapshots_collected_while_locked(self):
+        ledger = Ledger(stripes=1)
+        number = ledger.open(0)
+        threshold = gc.get_threshold()
+        gc.set_threshold(1)
+        try:
+            with ledger.snapshot() as kept:
+                for _ in range(100):
+                    snapshot = ledger.snapshot()
+                    snapshot.cycle = snapshot
+                    del snapshot
+                    ledger.deposit(number, 1)
+                    with ledger._locks[0]:
+                        gc.collect()  # must not take the lock we hold
+                self.assertEqual(list(kept), [0])
+                ledger.deposit(number, 1)  # closes the last one collected
+                self.assertEqual(ledger._snapshots, {kept._after[0]})
+        finally:
+            gc.set_threshold(*threshold)
+        ledger.deposit(number, 1)
+        self.assertEqual(ledger._undo, {})
+
+    def test_one_balance_saved_per_slot_and_snapshot(self):
+        ledger = Ledger()
+        number, other = ledger.open(0), ledger.open(0)
+        with ledger.snapshot() as snapshot:
+            for _ in range(10_000):
+                ledger.deposit(number, 1)
+            ledger.apply_batch([number, other], [1, 1])
+            self.assertEqual(len(ledger._undo[number]), 1)
+            with ledger.snapshot() as later:
+                ledger.transfer(number, other, 1)
+                ledger.transfer(number, other, 1)
+                self.assertEqual(len(ledger._undo[number]), 2)
+                self.assertEqual(list(later), [10_001, 1])
+            self.assertEqual(list(snapshot), [0, 0])
+
+    def test_snapshots_are_consistent_during_transfers(self):
+        ledger = Ledger(stripes=4)
+        numbers = [ledger.open(100) for _ in range(50)]
+        done = threading.Event()
+
+        def move_money():
+            i = 0
+            while not done.is_set():
+                ledger.transfer(numbers[i % 50], numbers[(i * 7 + 1) % 50], 1)
+                i += 1
+
+        thread = threading.Thread(target=move_money)
+        thread.start()
+        try:
+            for _ in range(200):
+                with ledger.snapshot() as snapshot:
+                    self.assertEqual(snapshot.total(), 5000)
+        finally:
+            done.set()
+            thread.join()
+
+
+class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
+    """Custom test runner to avoid FAILED message on unexpected successes."""
+
+    class resultclass(unittest.TextTestResult):
+        def wasSuccessful(self):
+            return not (self.failures or self.errors)
+
+
+if __name__ == "__main__":
+    from platform import python_version
+    import sys
+
+    if sys.version_info < (3, 6):
+        sys.exit("Running {}.  Python 3.6 required.".format(python_version()))
+    unittest.main(verbosity=2, testRunner=AllowUnexpectedSuccessRunner)
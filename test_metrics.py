@@ -0,0 +1,140 @@
+import io
+import unittest
+
+from bankaccount import BankAccount
+from deep_flatten import deep_flatten
+from fuzzystring import FuzzyString
+import metrics
+from parse_ranges import parse_ranges
+
+
+class MetricsTests(unittest.TestCase):
+
+    """Tests for the metrics module and the instrumented morsels."""
+
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+
+    def test_bank_account_operations(self):
+        mary_account, dana_account = BankAccount(100), BankAccount()
+        mary_account.deposit(10)
+        mary_account.transfer(dana_account, 50)
+        with self.assertRaises(ValueError):
+            dana_account.withdraw(60)
+        current = metrics.stats()
+        self.assertEqual(current["counters"], {"bankaccount.withdraw.rejected": 1})
+        histograms = current["histograms"]
+        self.assertEqual(
+            {name: histogram["count"] for name, histogram in histograms.items()},
+            {
+                "bankaccount.deposit.seconds": 1,
+                "bankaccount.transfer.seconds": 1,
+                "bankaccount.withdraw.seconds": 1,
+            },
+        )
+        deposits = histograms["bankaccount.deposit.seconds"]
+        self.assertEqual(sum(deposits["buckets"].values()), 1)
+
+    def test_disabled(self):
+        metrics.disable()
+        self.assertNotIn("timed", repr(BankAccount.deposit))
+        BankAccount().deposit(5)
+        list(deep_flatten([1, [2]]))
+        list(parse_ranges("1-3"))
+        FuzzyString("Éclair") == "eclair"
+        self.assertEqual(metrics.stats(), {"counters": {}, "histograms": {}})
+
+    def test_deep_flatten(self):
+        self.assertEqual(list(deep_flatten([1, [2, [3, "a"]], []])), [1, 2, 3, "a"])
+        current = metrics.stats()
+        self.assertEqual(current["counters"]["deep_flatten.leaves"], 4)
+        self.assertEqual(current["histograms"]["deep_flatten.depth"]["sum"], 3)
+        tree = ["leaf"]
+        for _ in range(20_000):
+            tree = [tree]
+        metrics.reset()
+        self.assertEqual(list(deep_flatten(tree)), ["leaf"])
+        depths = metrics.stats()["histograms"]["deep_flatten.depth"]
+        self.assertEqual(depths["sum"], 20_001)
+
+    def test_deep_flatten_paths_and_arrays(self):
+        list(deep_flatten([1, [2, [3]]], enumerate_paths=True))
+        deep_flatten([[1, 2], [[3]]], as_array=True)
+        current = metrics.stats()
+        self.assertEqual(current["counters"]["deep_flatten.calls"], 2)
+        self.assertEqual(current["counters"]["deep_flatten.leaves"], 6)
+        self.assertEqual(current["histograms"]["deep_flatten.depth"]["sum"], 3 + 3)
+
+    def test_parse_ranges(self):
+        list(parse_ranges("1-10,20"))
+        list(parse_ranges(io.StringIO("5-6"), batch=2))
+        counters = metrics.stats()["counters"]
+        self.assertEqual(counters["parse_ranges.integers"], 13)
+        self.assertEqual(counters["parse_ranges.ranges"], 3)
+
+    def test_fuzzystring(self):
+        FuzzyString("Ωmega unique") == "ωMEGA unique"
+        counters = metrics.stats()["counters"]
+        self.assertEqual(counters["fuzzystring.keys"], 2)
+        self.assertGreaterEqual(counters["fuzzystring.unicode_normalizations"], 1)
+
+    def test_dump(self):
+        metrics.count("example.events", 3)
+        metrics.observe("example.seconds", 0.005)
+        self.assertEqual(
+            metrics.dump().splitlines(),
+            [
+                "# TYPE morsels_example_events_total counter",
+                "morsels_example_events_total 3",
+                "# TYPE morsels_example_seconds histogram",
+                'morsels_example_seconds_bucket{le="1e-06"} 0',
+                'morsels_example_seconds_bucket{le="1e-05"} 0',
+                'morsels_example_seconds_bucket{le="0.0001"} 0',
+                'morsels_example_seconds_bucket{le="0.001"} 0',
+                'morsels_example_seconds_bucket{le="0.01"} 1',
+                'morsels_example_seconds_bucket{le="0.1"} 1',
+                'morsels_example_seconds_bucket{le="1"} 1',
+                'morsels_example_seconds_bucket{le="+Inf"} 1',
+                "morsels_example_seconds_sum 0.005",
+                "morsels_example_seconds_count 1",
+            ],
+        )
+
+    def test_dump_instrumented_calls(self):
+        account = BankAccount(5)
+        account.deposit(1)
+        with self.assertRaises(ValueError):
+            account.withdraw(10)
+        lines = metrics.dump().splitlines()
+        types = [line for line in lines if line.startswith("# TYPE")]
+        self.assertEqual(types, [
+            "# TYPE morsels_bankaccount_withdraw_rejected_total counter",
+            "# TYPE morsels_bankaccount_deposit_seconds histogram",
+            "# TYPE morsels_bankaccount_withdraw_seconds histogram",
+        ])
+        # Every metric name appears under one TYPE only
+        names = [line.split()[2] for line in types]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn("morsels_bankaccount_withdraw_rejected_total 1", lines)
+        self.assertIn("morsels_bankaccount_deposit_seconds_count 1", lines)
+        self.assertIn('morsels_bankaccount_withdraw_seconds_bucket{le="+Inf"} 1', lines)
+
+
+class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
+    """Custom test runner to avoid FAILED message on unexpected successes."""
+
+    class resultclass(unittest.TextTestResult):
+        def wasSuccessful(self):
+            return not (self.failures or self.errors)
+
+
+if __name__ == "__main__":
+    from platform import python_version
+    import sys
+
+    if sys.version_info < (3, 6):
+        sys.exit("Running {}.  Python 3.6 required.".format(python_version()))
+    unittest.main(verbosity=2, testRunner=AllowUnexpectedSuccessRunner)
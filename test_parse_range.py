@@ -1,6 +1,16 @@
+import io
+import random
 import unittest
 
-from parse_ranges import parse_ranges
+from parse_ranges import (
+    RangeSet,
+    cache_clear,
+    cache_info,
+    compile_ranges,
+    format_ranges,
+    parse_ranges,
+    set_cache_size,
+)
 
 
 class ParseRangesTests(unittest.TestCase):
@@ -41,13 +51,222 @@ class ParseRangesTests(unittest.TestCase):
         )
 
     # To test bonus 3, comment out the next line
-    @unittest.expectedFailure
     def test_ignore_arrows(self):
         self.assertEqual(
             list(parse_ranges("0, 4-8, 20->exit, 43-45")),
             [0, 4, 5, 6, 7, 8, 20, 43, 44, 45],
         )
 
+    def test_streams(self):
+        self.assertEqual(
+            list(parse_ranges(io.StringIO("0, 4-8, 20->exit, 43-45"))),
+            [0, 4, 5, 6, 7, 8, 20, 43, 44, 45],
+        )
+        self.assertEqual(list(parse_ranges(io.BytesIO(b"1-3,7"))), [1, 2, 3, 7])
+        self.assertEqual(list(parse_ranges(b"1-3,7")), [1, 2, 3, 7])
+
+    def test_stream_is_read_lazily(self):
+        stream = io.StringIO("1-2," * 100_000 + "3")
+        numbers = parse_ranges(stream)
+        self.assertEqual(next(numbers), 1)
+        self.assertLess(stream.tell(), len(stream.getvalue()))
+        self.assertEqual(sum(1 for _ in numbers), 200_000)
+
+    def test_items_across_chunk_boundaries(self):
+        class TrickleStream:
+            def __init__(self, text):
+                self.text = text
+
+            def read(self, size):
+                chunk, self.text = self.text[:3], self.text[3:]
+                return chunk
+
+        spec = "10-12, 4,  100-101,7->exit,8"
+        self.assertEqual(list(parse_ranges(TrickleStream(spec))), list(parse_ranges(spec)))
+
+    def test_batches(self):
+        batches = list(parse_ranges("0-4,7,10-13", batch=4))
+        self.assertEqual(
+            [batch.tolist() for batch in batches],
+            [[0, 1, 2, 3], [4, 7, 10, 11], [12, 13]],
+        )
+        self.assertTrue(all(batch.typecode == "q" for batch in batches))
+        batches = parse_ranges("0-5000000,9000000-12000000", batch=65536)
+        first = next(batches)
+        self.assertEqual((len(first), first[0], first[-1]), (65536, 0, 65535))
+        self.assertEqual(sum(len(batch) for batch in batches), 8000002 - 65536)
+        with self.assertRaises(ValueError):
+            next(parse_ranges("1-2", batch=0))
+
+    def test_error_positions(self):
+        with self.assertRaisesRegex(ValueError, "'4-x' at position 6"):
+            list(parse_ranges("1-2,  4-x,5"))
+        with self.assertRaisesRegex(ValueError, "position 4"):
+            list(parse_ranges(io.StringIO("1-2,")))
+        with self.assertRaisesRegex(ValueError, "position 0"):
+            list(parse_ranges(","))
+
+    def test_empty_spec(self):
+        for spec in ["", "  ", io.StringIO(""), io.BytesIO(b" \n")]:
+            with self.subTest(spec=spec):
+                self.assertEqual(list(parse_ranges(spec)), [])
+                self.assertEqual(list(parse_ranges(spec, batch=4)), [])
+        self.assertEqual(compile_ranges(""), RangeSet())
+
+
+class ParseCacheTests(unittest.TestCase):
+    """Tests for the cache of parsed range specs."""
+
+    def setUp(self):
+        cache_clear()
+
+    def tearDown(self):
+        set_cache_size(256)
+
+    def test_repeated_specs_hit_the_cache(self):
+        self.assertEqual(list(parse_ranges("0-0,4-8")), [0, 4, 5, 6, 7, 8])
+        self.assertEqual(list(parse_ranges("0-0, 4-8")), [0, 4, 5, 6, 7, 8])
+        self.assertEqual(list(parse_ranges(" 0-0 ,4-8")), [0, 4, 5, 6, 7, 8])
+        info = cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 1, 1))
+
+    def test_fresh_iterator_each_call(self):
+        numbers1 = parse_ranges("1-3")
+        numbers2 = parse_ranges("1-3")
+        self.assertEqual(next(numbers1), 1)
+        self.assertEqual(list(numbers2), [1, 2, 3])
+        self.assertEqual(list(numbers1), [2, 3])
+
+    def test_cache_size(self):
+        set_cache_size(2)
+        for spec in ["1", "2", "3", "1"]:
+            list(parse_ranges(spec))
+        info = cache_info()
+        self.assertEqual((info.maxsize, info.currsize, info.misses), (2, 2, 4))
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaisesRegex(ValueError, "position 7"):
+                list(parse_ranges("1-2 ,  x"))
+        self.assertEqual(cache_info().currsize, 0)
+
+
+class RangeSetTests(unittest.TestCase):
+    """Tests for compile_ranges and RangeSet."""
+
+    def test_membership_and_len(self):
+        selection = compile_ranges("8-10, 1-2,4-4,2-3")
+        self.assertEqual(list(selection), [1, 2, 3, 4, 8, 9, 10])
+        self.assertEqual(len(selection), 7)
+        self.assertIn(4, selection)
+        self.assertNotIn(5, selection)
+        self.assertNotIn(11, selection)
+        self.assertNotIn(0, selection)
+        self.assertNotIn("4", selection)
+        self.assertEqual(str(selection), "1-4,8-10")
+        self.assertEqual(repr(selection), "RangeSet('1-4,8-10')")
+        self.assertEqual(compile_ranges("1-4,8-10"), selection)
+        self.assertEqual(compile_ranges(io.StringIO("1-4, 8-10")), selection)
+        selection = compile_ranges("1,5-3,7")
+        self.assertEqual(list(selection), [1, 7])
+        self.assertEqual(len(selection), 2)
+        self.assertNotIn(4, selection)
+        self.assertEqual(str(selection), "1,7")
+
+    def test_huge_spans(self):
+        selection = compile_ranges("100-1000000000000")
+        self.assertIn(734512, selection)
+        self.assertNotIn(99, selection)
+        self.assertEqual(len(selection), 1000000000000 - 99)
+        self.assertEqual(next(iter(selection)), 100)
+
+    def test_set_operations(self):
+        rng = random.Random(1234)
+        for _ in range(200):
+            spec1, spec2 = (
+                ",".join(
+                    f"{start}-{start + rng.randrange(8)}"
+                    for start in rng.sample(range(60), rng.randrange(6))
+                )
+                or "0-0"
+                for _ in range(2)
+            )
+            set1, set2 = set(parse_ranges(spec1)), set(parse_ranges(spec2))
+            range_set1, range_set2 = compile_ranges(spec1), compile_ranges(spec2)
+            self.assertEqual(list(range_set1 | range_set2), sorted(set1 | set2))
+            self.assertEqual(list(range_set1 & range_set2), sorted(set1 & set2))
+            self.assertEqual(list(range_set1 - range_set2), sorted(set1 - set2))
+            self.assertEqual(len(range_set1 - range_set2), len(set1 - set2))
+
+    def test_empty(self):
+        self.assertFalse(RangeSet())
+        self.assertEqual(len(RangeSet([(5, 5)])), 0)
+        self.assertEqual(list(RangeSet([(3, 5), (0, 2)])), [0, 1, 3, 4])
+        self.assertEqual(len(compile_ranges("1,5-3")), 1)
+        self.assertEqual(compile_ranges("1,5-3,7"), compile_ranges("1,7"))
+
+
+class FormatRangesTests(unittest.TestCase):
+
+    """Tests for format_ranges."""
+
+    def test_runs(self):
+        self.assertEqual(format_ranges([1, 2, 3, 5, 8, 9, 10]), "1-3,5,8-10")
+        self.assertEqual(format_ranges(iter([0, 0, 1, 1, 4])), "0-1,4")
+        self.assertEqual(format_ranges(range(10**6)), "0-999999")
+        self.assertEqual(format_ranges([]), "")
+
+    def test_stream(self):
+        stream = io.StringIO()
+        self.assertIsNone(format_ranges([2, 3, 4, 7], stream))
+        self.assertEqual(stream.getvalue(), "2-4,7")
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            format_ranges([1, 3, 2])
+        with self.assertRaises(ValueError):
+            format_ranges([-1, 0])
+        with self.assertRaises(ValueError):
+            format_ranges([5, 6, 7, 1], window=2)
+        with self.assertRaises(ValueError):
+            format_ranges([1], window=0)
+
+    def test_non_integers(self):
+        with self.assertRaises(TypeError):
+            format_ranges([1.5, 2.5])
+        with self.assertRaises(TypeError):
+            format_ranges([1, 2.0], window=2)
+        with self.assertRaises(TypeError):
+            format_ranges(["1"], io.StringIO())
+        # Integer-like values are fine
+        self.assertEqual(format_ranges([True, 2, 3]), "1-3")
+
+    def test_round_trips(self):
+        rng = random.Random(4321)
+        for size in [0] + [rng.randrange(0, 60) for _ in range(300)]:
+            numbers = sorted(rng.sample(range(200), size))
+            spec = format_ranges(numbers)
+            self.assertEqual(list(parse_ranges(spec)), numbers)
+            self.assertEqual(format_ranges(parse_ranges(spec)), spec)
+            self.assertEqual(str(compile_ranges(spec)), spec)
+            stream = io.StringIO()
+            format_ranges(numbers + numbers[-1:], stream)
+            self.assertEqual(stream.getvalue(), spec)
+
+    def test_unsorted_round_trips(self):
+        rng = random.Random(8765)
+        for size in [0] + [rng.randrange(0, 60) for _ in range(300)]:
+            numbers = sorted(rng.sample(range(200), size))
+            window = rng.randrange(1, 10)
+            # Move each number less than window places from where it belongs
+            shuffled = list(numbers)
+            for start in range(0, len(shuffled), window):
+                block = shuffled[start:start + window]
+                rng.shuffle(block)
+                shuffled[start:start + window] = block
+            spec = format_ranges(shuffled, window=window)
+            self.assertEqual(list(parse_ranges(spec)), numbers)
+
 
 class AllowUnexpectedSuccessRunner(unittest.TextTestRunner):
     """Custom test runner to avoid FAILED message on unexpected successes."""